@@ -1,15 +1,34 @@
 import os
+import time
+import asyncio
 import datetime
-from flask import Flask, request, url_for, session, redirect, render_template
+import hashlib
+from flask import Flask, request, url_for, session, redirect, render_template, g
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth
 from dotenv import load_dotenv
-from scraper import scrape_tracks, get_stations
-from spotify_client import create_playlist_and_add_tracks
+from scraper import build_scrape_url, iter_track_pages_async, coverage_for, UpstreamError
+from circuit_breaker import CircuitOpenError
+import cache_warmer
+import fingerprints
+import health
+import profiling
+import station_health
+import subscriptions
+from spotify_client import build_playlist_name, build_merged_playlist_name, spotify_for_token, spotify_session
+from spotify_async import AsyncSpotify, create_playlist_and_add_tracks, refresh_access_token, PlaylistStream
+from track_merge import merge_track_lists, MERGE_ORDERS
 
 load_dotenv(override=True)
 
-app = Flask(__name__)
+class App(Flask):
+    # Under WSGI (Vercel, app.run) each async view runs to completion on an event loop in its own request
+    # thread, where the request hooks and the profiler see it. Flask's default would hand it to asgiref's
+    # loop thread instead. asgi.py awaits the same views on the server's loop.
+    def async_to_sync(self, func):
+        return lambda *args, **kwargs: asyncio.run(func(*args, **kwargs))
+
+app = App(__name__)
 app.secret_key = os.environ.get("FLASK_SECRET_KEY")
 if not app.secret_key:
     # Use a secure random key if not provided (note: sessions will reset on app restart)
@@ -26,6 +45,13 @@ else:
     SPOTIPY_REDIRECT_URI = raw_redirect_uri
 # User must update Dashboard to this URI or use the one they configured.
 
+# How many stations a single bulk/cron request works on at once (bounded to stay inside Spotify's rate limits)
+BULK_CONCURRENCY = int(os.environ.get("BULK_CONCURRENCY", "4"))
+# Bulk and cron exports write each 100-track batch while later pages are still being scraped
+STREAMING_EXPORT = os.environ.get("STREAMING_EXPORT", "").lower() in ("1", "true", "yes")
+# asgi.py marks the requests it awaits on its event loop with this environ key
+EVENT_LOOP_ENVIRON_KEY = 'sxmify.event_loop'
+
 from spotipy.cache_handler import MemoryCacheHandler
 
 def create_spotify_oauth():
@@ -35,12 +61,157 @@ def create_spotify_oauth():
         client_secret=SPOTIPY_CLIENT_SECRET,
         redirect_uri=SPOTIPY_REDIRECT_URI,
         scope="playlist-modify-public playlist-modify-private",
-        cache_handler=MemoryCacheHandler()
+        cache_handler=MemoryCacheHandler(),
+        requests_session=spotify_session
     )
 
+async def run_concurrently(func, items):
+    # Awaits func for up to BULK_CONCURRENCY items at once; results keep the order of items
+    slots = asyncio.Semaphore(BULK_CONCURRENCY)
+
+    async def run(item):
+        async with slots:
+            return await func(item)
+    return await asyncio.gather(*(run(item) for item in items))
+
+async def stream_export(sp, target_url, limit, station_id, scrape_type, days, station_name, user_key=None):
+    # Returns (playlist_url, track_count); the playlist is looked up and filled while the pages arrive.
+    # The scrape updates the feed's negative-cache entry just like scrape_feed().
+    playlist = PlaylistStream(sp, station_id, scrape_type, days, station_name, user_key=user_key)
+    try:
+        async for tracks in iter_track_pages_async(target_url, limit=limit):
+            playlist.add([t['id'] for t in tracks])
+    except BaseException as e:
+        await playlist.abort()
+        record_scrape_error(station_id, scrape_type, e)
+        raise
+    record_feed_result(station_id, scrape_type, len(playlist.track_ids))
+    playlist_url = await playlist.finish()
+    return playlist_url, len(playlist.track_ids)
+
+async def scrape_feed(station, scrape_type, days, limit):
+    # Scrape one station feed (station URL or id) and update its negative-cache entry
+    station_id = station.rstrip('/').split('/')[-1]
+    try:
+        tracks = await cache_warmer.scrape_tracks_async(build_scrape_url(station, scrape_type, days), limit=limit)
+    except Exception as e:
+        record_scrape_error(station_id, scrape_type, e)
+        raise
+    record_feed_result(station_id, scrape_type, len(tracks))
+    return tracks
+
+def record_scrape_error(station_id, scrape_type, error):
+    # An open circuit or a blocked/failed upstream call is about xmplaylist as a whole, so it doesn't count against the station
+    if isinstance(error, Exception) and not isinstance(error, (CircuitOpenError, UpstreamError)):
+        station_health.record_failure(station_id, scrape_type, str(error))
+
+def record_feed_result(station_id, scrape_type, track_count):
+    # Only bulk and cron runs persist station health; the interactive views scrape without touching disk
+    coverage = coverage_for(station_id, scrape_type)
+    if coverage:
+        station_health.record_coverage(station_id, scrape_type, coverage['seen'], coverage['with_spotify'])
+    if track_count:
+        station_health.record_success(station_id, scrape_type)
+    else:
+        station_health.record_failure(station_id, scrape_type, "No tracks found")
+
+async def export_merged(sp, stations, scrape_type, days, order, custom_name=None, user_key=None, limit=100, force=False):
+    # stations: [(station url or id, display name)]. Scrapes them all concurrently, merges the tracks
+    # and writes a single playlist. Returns (merged result, per-station results).
+    async def scrape(station):
+        # Failures are returned rather than raised so one station can't sink the others
+        try:
+            skip = None if force else station_health.skip_reason(station.rstrip('/').split('/')[-1], scrape_type)
+            if skip:
+                raise station_health.FeedSkipped(skip)
+            return await scrape_feed(station, scrape_type, days, limit)
+        except Exception as e:
+            return e
+
+    scraped = await run_concurrently(scrape, [station for station, _ in stations])
+
+    station_results = []
+    track_lists = []
+    for (station, station_name), tracks in zip(stations, scraped):
+        res = {'station_name': station_name, 'success': False, 'track_count': 0, 'playlist_url': None, 'error': None,
+               'spotify_coverage': station_health.coverage_pct(station.rstrip('/').split('/')[-1], scrape_type)}
+        if isinstance(tracks, station_health.FeedSkipped):
+            res['error'] = str(tracks)
+            res['skipped'] = True
+        elif isinstance(tracks, Exception):
+            print(f"Error processing {station_name}: {tracks}")
+            res['error'] = str(tracks)
+        elif not tracks:
+            res['error'] = "No tracks found"
+        else:
+            track_lists.append([t['id'] for t in tracks])
+            res['success'] = True
+            res['track_count'] = len(tracks)
+        station_results.append(res)
+
+    playlist_name = build_merged_playlist_name([name for _, name in stations], scrape_type, days, custom_name)
+    track_ids = merge_track_lists(track_lists, order)
+    merged = {'station_name': playlist_name, 'success': False, 'track_count': len(track_ids), 'playlist_url': None, 'error': None}
+    if not track_ids:
+        merged['error'] = "No tracks found"
+        return merged, station_results
+
+    print(f"Merged {sum(len(t) for t in track_lists)} tracks from {len(track_lists)} stations into {len(track_ids)} ({order})")
+    try:
+        merged['playlist_url'] = await create_playlist_and_add_tracks(sp, track_ids, custom_name=playlist_name, user_key=user_key)
+        merged['success'] = True
+    except Exception as e:
+        print(f"Error writing merged playlist: {e}")
+        merged['error'] = str(e)
+    return merged, station_results
+
+@app.before_request
+def start_background_work():
+    cache_warmer.start_warmer()
+
+@app.before_request
+def start_profile():
+    if request.path.startswith('/debug/profiles'):
+        return
+    if request.environ.get(EVENT_LOOP_ENVIRON_KEY):
+        # The profiler samples threads, and async views served by asgi.py share the event loop's thread
+        return
+    kind = 'cron' if request.path.startswith('/api/cron/') else 'request'
+    # The header forces a profile, but only for callers holding the cron secret
+    forced = request.headers.get('X-Profile') == '1' and cron_authorized()
+    if profiling.should_profile(kind, forced):
+        g.profile = profiling.start(f"{request.method} {request.path}", kind)
+
+@app.after_request
+def note_profile_status(response):
+    g.profile_status = response.status_code
+    return response
+
+@app.teardown_request
+def finish_profile(exc):
+    started = g.pop('profile', None)
+    if started:
+        profiling.finish(started, g.pop('profile_status', 500 if exc else None))
+
+@app.before_request
+def note_cron_start():
+    if request.path.startswith('/api/cron/'):
+        g.cron_started = time.time()
+
+@app.after_request
+def checkpoint_cron(response):
+    # Last run of each cron job, for /health
+    started = g.pop('cron_started', None)
+    if started and response.status_code != 401:
+        try:
+            health.record_cron_run(request.path, started, response.status_code, response.get_json(silent=True))
+        except OSError as e:
+            print(f"Warning: could not save cron checkpoint: {e}")
+    return response
+
 @app.route('/')
-def index():
-    stations = get_stations()
+async def index():
+    stations = await cache_warmer.get_stations_async()
     is_logged_in = session.get('token_info') is not None
     user_display_name = session.get('user_display_name') if is_logged_in else None
     user_image_url = session.get('user_image_url') if is_logged_in else None
@@ -60,12 +231,15 @@ def login():
         session['return_to_review'] = True
     elif request.args.get('next') == 'bulk':
         session['return_to_bulk'] = True
+    elif request.args.get('next') == 'subscriptions':
+        session['return_to_subscriptions'] = True
         
     return redirect(auth_url)
 
 @app.route('/callback')
 def callback():
     sp_oauth = create_spotify_oauth()
+    return_to_subscriptions = session.get('return_to_subscriptions')
     session.clear()
     code = request.args.get('code')
     token_info = sp_oauth.get_access_token(code)
@@ -73,8 +247,9 @@ def callback():
     
     # Get user info for display
     try:
-        sp = spotipy.Spotify(auth=token_info['access_token'])
+        sp = spotify_for_token(token_info['access_token'])
         current_user = sp.current_user()
+        session['user_id'] = current_user.get('id')
         session['user_display_name'] = current_user.get('display_name')
         if current_user.get('images'):
             session['user_image_url'] = current_user['images'][0]['url']
@@ -82,6 +257,9 @@ def callback():
         pass
 
     # Check for return to review page
+    if return_to_subscriptions:
+        return redirect(url_for('manage_subscriptions'))
+
     if session.get('return_to_review') and session.get('last_scrape'):
          session.pop('return_to_review', None)
          return redirect(url_for('show_review'))
@@ -93,12 +271,12 @@ def callback():
     # Check for pending export
     pending_export = session.get('pending_export')
     if pending_export:
-        return finish_export(token_info, pending_export)
+        return app.ensure_sync(finish_export)(token_info, pending_export)
         
     return redirect(url_for('index'))
 
 @app.route('/scrape', methods=['POST'])
-def scrape():
+async def scrape():
     # Authentication check intentionally skipped to allow guest scraping
     
     # Check token expiration IF logged in (just cleanup)
@@ -107,7 +285,7 @@ def scrape():
         sp_oauth = create_spotify_oauth()
         if sp_oauth.is_token_expired(token_info):
             print("Token expired. Refreshing...")
-            token_info = sp_oauth.refresh_access_token(token_info['refresh_token'])
+            token_info = await refresh_access_token(sp_oauth, token_info['refresh_token'])
             session['token_info'] = token_info
     
     base_url = request.form.get('url')
@@ -128,7 +306,7 @@ def scrape():
     print(f"DEBUG: base_url='{base_url}', scrape_type='{scrape_type}', days='{days}', limit={limit}")
 
     if not base_url:
-        return render_template('index.html', error="Please select a station.", stations=get_stations(), user_display_name=session.get('user_display_name'))
+        return render_template('index.html', error="Please select a station.", stations=await cache_warmer.get_stations_async(), user_display_name=session.get('user_display_name'))
     
     # Clean base_url
     base_url = base_url.rstrip('/')
@@ -146,10 +324,15 @@ def scrape():
         scrape_description = "Recently Played"
 
     print(f"Scraping {target_url} (limit={limit})...")
-    tracks = scrape_tracks(target_url, limit=limit)
+    try:
+        tracks = await cache_warmer.scrape_tracks_async(target_url, limit=limit)
+    except CircuitOpenError as e:
+        return render_template('index.html', error=f"XM Playlist is not responding right now. {e}", stations=await cache_warmer.get_stations_async(), user_display_name=session.get('user_display_name'))
+    except UpstreamError as e:
+        return render_template('index.html', error=f"{e}. Please try again later.", stations=await cache_warmer.get_stations_async(), user_display_name=session.get('user_display_name'))
     
     if not tracks:
-        return render_template('index.html', error="No tracks found on that page.", stations=get_stations(), user_display_name=session.get('user_display_name'))
+        return render_template('index.html', error="No tracks found on that page.", stations=await cache_warmer.get_stations_async(), user_display_name=session.get('user_display_name'))
 
     # Extract station_id from URL
     station_id = "unknown"
@@ -178,7 +361,7 @@ def scrape():
 
 
 @app.route('/review')
-def show_review():
+async def show_review():
     """Display review page using session data (for redirects after login)"""
     last_scrape = session.get('last_scrape')
     if not last_scrape:
@@ -215,7 +398,12 @@ def show_review():
     # Re-scraping is safer for state.
     
     print(f"Re-Scraping {target_url} (limit={limit})...")
-    tracks = scrape_tracks(target_url, limit=limit)
+    try:
+        tracks = await cache_warmer.scrape_tracks_async(target_url, limit=limit)
+    except CircuitOpenError as e:
+        return render_template('index.html', error=f"XM Playlist is not responding right now. {e}", stations=await cache_warmer.get_stations_async(), user_display_name=session.get('user_display_name'))
+    except UpstreamError as e:
+        return render_template('index.html', error=f"{e}. Please try again later.", stations=await cache_warmer.get_stations_async(), user_display_name=session.get('user_display_name'))
     
     station_id = "unknown"
     try:
@@ -241,7 +429,7 @@ def show_review():
 
 
 @app.route('/export', methods=['POST'])
-def export():
+async def export():
     # Gather form data
     track_ids = request.form.getlist('track_ids')
     station_id = request.form.get('station_id', 'unknown')
@@ -250,6 +438,8 @@ def export():
     scrape_type = request.form.get('scrape_type', 'recent')
     days = request.form.get('days', None)
     reverse_order = request.form.get('reverse_order')
+    # Set by "Write anyway" on the success page when the playlist was left as it was
+    force = bool(request.form.get('force'))
     
     if reverse_order:
          track_ids.reverse()
@@ -260,7 +450,8 @@ def export():
         'station_name': station_name,
         'custom_name': custom_name,
         'scrape_type': scrape_type,
-        'days': days
+        'days': days,
+        'force': force
     }
 
     # Check if logged in
@@ -274,12 +465,12 @@ def export():
     sp_oauth = create_spotify_oauth()
     if sp_oauth.is_token_expired(token_info):
         print("Token expired (export). Refreshing...")
-        token_info = sp_oauth.refresh_access_token(token_info['refresh_token'])
+        token_info = await refresh_access_token(sp_oauth, token_info['refresh_token'])
         session['token_info'] = token_info
         
-    return finish_export(token_info, export_data)
+    return await finish_export(token_info, export_data)
 
-def finish_export(token_info, export_data):
+async def finish_export(token_info, export_data):
     """Helper to actually create the playlist"""
     track_ids = export_data.get('track_ids')
     station_id = export_data.get('station_id')
@@ -287,16 +478,29 @@ def finish_export(token_info, export_data):
     custom_name = export_data.get('custom_name')
     scrape_type = export_data.get('scrape_type', 'recent')
     days = export_data.get('days')
+    user_key = session.get('user_id')
     
     print(f"Starting export for {len(track_ids)} tracks...")
     
     if not track_ids:
         return redirect(url_for('index'))
+
+    # Same tracks as the last export: leave the playlist alone, but say so and offer to write it anyway
+    # (e.g. after it was edited or deleted on Spotify)
+    playlist_name = build_playlist_name(station_id, scrape_type, days, station_name, custom_name)
+    unchanged_url = None
+    if user_key and not export_data.get('force'):
+        unchanged_url = fingerprints.unchanged_playlist_url(user_key, playlist_name, track_ids)
+    if unchanged_url:
+        session.pop('pending_export', None)
+        return render_template('success.html', playlist_url=unchanged_url, count=len(track_ids), unchanged=True,
+                               export_data=export_data)
         
     # Create Playlist
-    sp = spotipy.Spotify(auth=token_info['access_token'])
     try:
-        playlist_url = create_playlist_and_add_tracks(sp, track_ids, station_id, scrape_type, days, station_name, custom_name)
+        async with AsyncSpotify(token_info['access_token']) as sp:
+            playlist_url = await create_playlist_and_add_tracks(sp, track_ids, station_id, scrape_type, days, station_name, custom_name,
+                                                               user_key=user_key, skip_unchanged=False)
         print(f"Playlist created successfully: {playlist_url}")
         
         # Clear pending if successful
@@ -308,13 +512,15 @@ def finish_export(token_info, export_data):
 
 @app.route('/bulk')
 def bulk_select():
-    stations = get_stations()
+    stations = cache_warmer.get_stations()
     
     # Check for saved bulk data (from a previous login attempt)
     saved_data = session.get('saved_bulk_data', {})
     selected_urls = saved_data.get('station_urls', [])
     selected_scrape_type = saved_data.get('scrape_type', 'recent')
     selected_days = saved_data.get('days', '7')
+    selected_merge = saved_data.get('merge')
+    selected_merge_order = saved_data.get('merge_order', 'interleave')
     
     is_logged_in = session.get('token_info') is not None
     user_display_name = session.get('user_display_name') if is_logged_in else None
@@ -330,17 +536,24 @@ def bulk_select():
                            selected_urls=selected_urls,
                            selected_scrape_type=selected_scrape_type,
                            selected_days=selected_days,
+                           selected_merge=selected_merge,
+                           selected_merge_order=selected_merge_order,
                            is_logged_in=is_logged_in,
                            user_display_name=user_display_name,
                            user_image_url=user_image_url)
 
 @app.route('/bulk_export', methods=['POST'])
-def bulk_export():
+async def bulk_export():
     # 1. Capture Form Data Immediately
     station_urls = request.form.getlist('station_urls')
     scrape_type = request.form.get('scrape_type', 'recent')
     days = request.form.get('days', '7')
     limit = 100 
+    # Merged mode: every selected station goes into one playlist
+    merge = bool(request.form.get('merge'))
+    merge_order = request.form.get('merge_order', 'interleave')
+    if merge_order not in MERGE_ORDERS:
+        merge_order = 'interleave'
 
     # 2. Check Login
     token_info = session.get('token_info', None)
@@ -349,30 +562,41 @@ def bulk_export():
         session['saved_bulk_data'] = {
             'station_urls': station_urls,
             'scrape_type': scrape_type,
-            'days': days
+            'days': days,
+            'merge': merge,
+            'merge_order': merge_order
         }
         return redirect(url_for('login', next='bulk'))
 
     # Check token expiration
     sp_oauth = create_spotify_oauth()
     if sp_oauth.is_token_expired(token_info):
-        token_info = sp_oauth.refresh_access_token(token_info['refresh_token'])
+        token_info = await refresh_access_token(sp_oauth, token_info['refresh_token'])
         session['token_info'] = token_info
 
-    sp = spotipy.Spotify(auth=token_info['access_token'])
+    user_key = session.get('user_id')
     
     # Cleanup saved data if we are proceeding successfully
     session.pop('saved_bulk_data', None) 
     
     # Pre-fetch stations for name lookup
-    all_stations = get_stations()
+    all_stations = await cache_warmer.get_stations_async()
     station_map = {s['url']: s['name'] for s in all_stations}
+
+    if merge:
+        print(f"Starting merged export of {len(station_urls)} stations ({merge_order})...")
+        async with AsyncSpotify(token_info['access_token']) as sp:
+            merged, results = await export_merged(
+                sp, [(url, station_map.get(url, "Unknown Station")) for url in station_urls],
+                scrape_type, days if scrape_type == 'most_heard' else None, merge_order,
+                custom_name=request.form.get('merged_name') or None, user_key=user_key, limit=limit
+            )
+        return render_template('bulk_results.html', results=results, merged=merged)
     
-    results = []
     print(f"Starting bulk update for {len(station_urls)} stations...")
-    
-    for url in station_urls:
+    async def process_station(url):
          station_name = station_map.get(url, "Unknown Station")
+         station_id = "unknown"
          
          res = {
              'station_name': station_name,
@@ -384,24 +608,9 @@ def bulk_export():
          
          try:
              # 1. Scrape
-             target_url = url
-             if scrape_type == 'newest':
-                 target_url = f"{url}/newest"
-             elif scrape_type == 'most_heard':
-                 target_url = f"{url}/most-heard?days={days}"
-             
-             print(f"Bulk scraping: {target_url}")
-             tracks = scrape_tracks(target_url, limit=limit)
-             
-             if not tracks:
-                 res['error'] = "No tracks found"
-                 results.append(res)
-                 continue
-                 
-             track_ids = [t['id'] for t in tracks]
-             res['track_count'] = len(track_ids)
+             target_url = build_scrape_url(url, scrape_type, days)
              
-             # 2. Extract station_id for naming
+             # Extract station_id for naming
              station_id = "unknown"
              try:
                 parts = url.rstrip('/').split('/')
@@ -410,10 +619,35 @@ def bulk_export():
              except:
                  pass
 
-             # 3. Create Playlist
-             playlist_url = create_playlist_and_add_tracks(
-                 sp, track_ids, station_id, scrape_type, days, station_name
-             )
+             skip = station_health.skip_reason(station_id, scrape_type)
+             if skip:
+                 res['error'] = skip
+                 res['skipped'] = True
+                 return res
+
+             print(f"Bulk scraping: {target_url}")
+             if STREAMING_EXPORT:
+                 playlist_url, res['track_count'] = await stream_export(
+                     sp, target_url, limit, station_id, scrape_type, days, station_name, user_key=user_key
+                 )
+                 if not playlist_url:
+                     res['error'] = "No tracks found"
+                     return res
+             else:
+                 tracks = await scrape_feed(url, scrape_type, days, limit)
+
+                 if not tracks:
+                     res['error'] = "No tracks found"
+                     return res
+
+                 track_ids = [t['id'] for t in tracks]
+                 res['track_count'] = len(track_ids)
+
+                 # Create Playlist
+                 playlist_url = await create_playlist_and_add_tracks(
+                     sp, track_ids, station_id, scrape_type, days, station_name,
+                     user_key=user_key
+                 )
              
              res['success'] = True
              res['playlist_url'] = playlist_url
@@ -422,10 +656,67 @@ def bulk_export():
              print(f"Error processing {station_name}: {e}")
              res['error'] = str(e)
              
-         results.append(res)
+         res['spotify_coverage'] = station_health.coverage_pct(station_id, scrape_type)
+         return res
+
+    # Stations run concurrently; results keep the order they were selected in
+    async with AsyncSpotify(token_info['access_token']) as sp:
+        results = await run_concurrently(process_station, station_urls)
          
     return render_template('bulk_results.html', results=results)
 
+@app.route('/subscriptions', methods=['GET', 'POST'])
+def manage_subscriptions():
+    token_info = session.get('token_info', None)
+    user_id = session.get('user_id')
+    if not token_info or not user_id:
+        return redirect(url_for('login', next='subscriptions'))
+
+    error = None
+    if request.method == 'POST':
+        station_url = request.form.get('station_url', '')
+        parts = station_url.rstrip('/').split('/')
+        station_id = parts[parts.index('station') + 1] if 'station' in parts else None
+        if not station_id:
+            error = "Please select a station."
+        else:
+            try:
+                subscriptions.register_user(user_id, token_info['refresh_token'], session.get('user_display_name'))
+                subscriptions.add_subscription(
+                    user_id,
+                    station_id,
+                    request.form.get('scrape_type', 'recent'),
+                    request.form.get('days'),
+                    request.form.get('limit', 100),
+                    request.form.get('custom_name')
+                )
+                return redirect(url_for('manage_subscriptions'))
+            except ValueError as e:
+                error = str(e)
+            except OSError as e:
+                print(f"Could not save subscription: {e}")
+                error = "Subscriptions can't be saved on this server. They need a host with a persistent SXMIFY_STATE_DIR."
+
+    stations = cache_warmer.get_stations()
+    station_map = {s['id']: s['name'] for s in stations}
+
+    return render_template('subscriptions.html',
+                           subscriptions=subscriptions.list_subscriptions(user_id),
+                           stations=stations,
+                           station_map=station_map,
+                           error=error,
+                           is_logged_in=True,
+                           user_display_name=session.get('user_display_name'),
+                           user_image_url=session.get('user_image_url'))
+
+@app.route('/subscriptions/<sub_id>/delete', methods=['POST'])
+def delete_subscription(sub_id):
+    user_id = session.get('user_id')
+    if not user_id:
+        return redirect(url_for('login', next='subscriptions'))
+    subscriptions.remove_subscription(user_id, sub_id)
+    return redirect(url_for('manage_subscriptions'))
+
 @app.route('/logout')
 def logout():
     session.clear()
@@ -452,12 +743,14 @@ def show_token():
     """
     return html
 
-@app.route('/api/cron/update')
-def cron_update():
+def cron_authorized():
     auth_header = request.headers.get('Authorization')
     expected_secret = os.environ.get('CRON_SECRET')
-    
-    if not expected_secret or auth_header != f"Bearer {expected_secret}":
+    return bool(expected_secret) and auth_header == f"Bearer {expected_secret}"
+
+@app.route('/api/cron/update')
+async def cron_update():
+    if not cron_authorized():
         return {"error": "Unauthorized"}, 401
     
     # Allow station param, default to factionpunk
@@ -467,6 +760,13 @@ def cron_update():
     else:
          station_id = request.args.get('station', 'factionpunk')
          station_ids = [station_id]
+
+    # ?merge=interleave|ranked writes all stations into one playlist (optional ?name=)
+    merge_order = request.args.get('merge')
+    if merge_order and merge_order not in MERGE_ORDERS:
+        return {"error": f"Unknown merge order '{merge_order}'"}, 400
+    # ?force=1 retries stations that are backing off in the negative cache
+    force = request.args.get('force') == '1'
     
     refresh_token = os.environ.get('SPOTIPY_REFRESH_TOKEN')
     if not refresh_token:
@@ -474,55 +774,132 @@ def cron_update():
         
     try:
         sp_oauth = create_spotify_oauth()
-        token_info = sp_oauth.refresh_access_token(refresh_token)
+        token_info = await refresh_access_token(sp_oauth, refresh_token)
         if not token_info:
             return {"error": "Failed to refresh Spotify token"}, 500
              
-        sp = spotipy.Spotify(auth=token_info['access_token'])
-        
-        all_stations = get_stations()
-        results = []
+        # Stable per-account key for export fingerprints without spending a current_user() call
+        cron_user_key = "cron:" + hashlib.sha256(refresh_token.encode()).hexdigest()[:16]
         
-        for sid in station_ids:
+        all_stations = await cache_warmer.get_stations_async()
+
+        if merge_order:
+            station_names = {s['id']: s['name'] for s in all_stations}
+            async with AsyncSpotify(token_info['access_token']) as sp:
+                merged, results = await export_merged(
+                    sp, [(sid, station_names.get(sid, sid.replace('-', ' ').title())) for sid in station_ids],
+                    'recent', None, merge_order, custom_name=request.args.get('name'), user_key=cron_user_key, force=force
+                )
+            return {"merged": merged, "results": results}
+
+        async def update_station(sid):
              try:
-                 url = f"https://xmplaylist.com/station/{sid}"
-                 tracks = scrape_tracks(url, limit=100)
-                 
-                 if not tracks:
-                      results.append({"station": sid, "error": f"No tracks found for station {sid}"})
-                      continue
-                      
-                 track_ids = [t['id'] for t in tracks]
+                 url = build_scrape_url(sid)
                  
                  # Get station name from the scraper if possible, otherwise format ID loosely
                  station_url_suffix = f"/station/{sid}"
                  station_name = next((s['name'] for s in all_stations if s['url'].endswith(station_url_suffix)), sid.replace('-', ' ').title())
                  
-                 playlist_url = create_playlist_and_add_tracks(
-                     sp, track_ids, sid, 'recent', None, station_name
-                 )
+                 skip = None if force else station_health.skip_reason(sid, 'recent')
+                 if skip:
+                     return {"station": sid, "error": skip, "skipped": True}
+                 
+                 if STREAMING_EXPORT:
+                     playlist_url, track_count = await stream_export(
+                         sp, url, 100, sid, 'recent', None, station_name, user_key=cron_user_key
+                     )
+                     if not playlist_url:
+                         return {"station": sid, "error": f"No tracks found for station {sid}"}
+                 else:
+                     tracks = await scrape_feed(sid, 'recent', None, 100)
+                     
+                     if not tracks:
+                          return {"station": sid, "error": f"No tracks found for station {sid}"}
+                          
+                     track_ids = [t['id'] for t in tracks]
+                     track_count = len(track_ids)
+                     
+                     playlist_url = await create_playlist_and_add_tracks(
+                         sp, track_ids, sid, 'recent', None, station_name,
+                         user_key=cron_user_key
+                     )
                  
-                 results.append({
+                 return {
                      "success": True, 
                      "station": station_name,
                      "playlist_url": playlist_url, 
-                     "tracks_added": len(track_ids)
-                 })
+                     "tracks_added": track_count,
+                     "spotify_coverage": station_health.coverage_pct(sid, 'recent')
+                 }
              except Exception as inner_e:
                  import traceback
                  traceback.print_exc()
-                 results.append({"station": sid, "error": str(inner_e)})
+                 return {"station": sid, "error": str(inner_e)}
                  
+        async with AsyncSpotify(token_info['access_token']) as sp:
+            results = await run_concurrently(update_station, station_ids)
         return {"results": results}
     except Exception as e:
         import traceback
         traceback.print_exc()
         return {"error": str(e)}, 500
 
+@app.route('/api/cron/subscriptions')
+def cron_subscriptions():
+    if not cron_authorized():
+        return {"error": "Unauthorized"}, 401
+
+    # Optional station filter so the cycle can be split across several cron entries
+    stations_param = request.args.get('stations')
+    station_filter = [s.strip() for s in stations_param.split(',')] if stations_param else None
+
+    try:
+        station_names = {s['id']: s['name'] for s in cache_warmer.get_stations()}
+        return subscriptions.run_subscription_cycle(create_spotify_oauth(), station_names, station_filter)
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return {"error": str(e)}, 500
+
+@app.route('/debug/profiles')
+def profile_index():
+    if not cron_authorized():
+        return {"error": "Unauthorized"}, 401
+    try:
+        limit = int(request.args.get('limit', 20))
+    except ValueError:
+        return {"error": "limit must be a whole number"}, 400
+    return {"runs": profiling.slowest_runs(limit, request.args.get('kind'))}
+
+@app.route('/debug/profiles/<profile_id>')
+def profile_artifact(profile_id):
+    if not cron_authorized():
+        return {"error": "Unauthorized"}, 401
+    run = profiling.get_run(profile_id)
+    if not run or not os.path.exists(run['file']):
+        return {"error": "Profile not found"}, 404
+    with open(run['file']) as f:
+        return f.read(), 200, {'Content-Type': 'text/plain; charset=utf-8'}
+
+@app.route('/health')
+def health_report():
+    # Reports from already-collected state only; no upstream calls
+    report = health.report()
+    return report, 503 if report['status'] != 'ok' else 200
+
+@app.route('/debug/probe', methods=['POST'])
+def upstream_probe():
+    # Live upstream checks, rate limited to one per HEALTH_PROBE_INTERVAL per process
+    if not cron_authorized():
+        return {"error": "Unauthorized"}, 401
+    result, retry_in = health.run_probe()
+    if retry_in:
+        return {"error": "Probe rate limited", "retry_in_s": round(retry_in), "last_probe": result}, 429, \
+            {'Retry-After': str(int(retry_in) + 1)}
+    return result
+
 @app.route('/debug')
 def debug_info():
-    import os
-    import json
     import sys
     
     info = []
@@ -538,49 +915,14 @@ def debug_info():
         
     except Exception as e:
         info.append(f"File Error: {e}")
-        
-    # check stations
-    try:
-        from scraper import get_stations
-        stations = get_stations()
-        info.append(f"Station Count: {len(stations)}")
-        if stations:
-            info.append(f"Sample: {stations[0]}")
-    except Exception as e:
-        info.append(f"Station Error: {e}")
-
-    # check scraping tracks
-    try:
-        from scraper import scrape_tracks
-        # Test with SiriusXM Hits 1 (usually has data)
-        info.append("<br><strong>Testing Track Scrape (SiriusXM Hits 1)...</strong>")
-        tracks = scrape_tracks("https://xmplaylist.com/station/siriusxmhits1", limit=10)
-        info.append(f"Tracks Found: {len(tracks)}")
-        if tracks:
-            info.append(f"Sample Track: {tracks[0]}")
-        else:
-            info.append("No tracks found, likely blocked or empty.")
-            
-    except Exception as e:
-        info.append(f"Track Scrape Error: {e}")
 
-    # Raw API Test
-    try:
-        import cloudscraper
-        import html
-        url = "https://xmplaylist.com/api/station/siriusxmhits1"
-        info.append(f"<br><strong>Raw API Test ({url}) with CloudScraper...</strong>")
-        
-        scraper = cloudscraper.create_scraper()
-        resp = scraper.get(url)
-        info.append(f"Status Code: {resp.status_code}")
-        
-        text = resp.text
-        # Preview content (escape HTML to prevent rendering if it's a block page)
-        preview = html.escape(text[:1000])
-        info.append(f"Response Preview: {preview}")
-    except Exception as e:
-        info.append(f"Raw Request Error: {e}")
+    # Upstream state comes from /health; live checks are POST /debug/probe (cron secret, rate limited)
+    report = health.report()
+    info.append(f"Health: {report['status']} {report['problems']}")
+    upstream = report['upstream']
+    since = upstream['seconds_since_success']
+    info.append(f"xmplaylist.com breaker: {upstream['state']}, error rate {upstream['error_rate']:.0%}, "
+                f"last success {station_health.format_duration(since) + ' ago' if since is not None else 'never'}")
         
     return "<br>".join(info)
 
@@ -0,0 +1,150 @@
+import io
+import sys
+import asyncio
+import inspect
+from flask import request, request_started
+from werkzeug.exceptions import HTTPException
+from werkzeug.routing import RequestRedirect
+
+from app import app as flask_app, EVENT_LOOP_ENVIRON_KEY
+
+# ASGI entry point for the Procfile (gunicorn with uvicorn workers):
+#   gunicorn asgi:app --worker-class uvicorn_worker.UvicornWorker
+# Async views (/, /scrape, /review, /export, /bulk_export, /api/cron/update) are awaited on the worker's
+# event loop, so a request waiting on xmplaylist.com or Spotify holds no thread and one process can have
+# hundreds of them in flight. Every other route is a plain WSGI call on a thread from the loop's default
+# executor. asgiref's WsgiToAsgi isn't used because it runs every request on one shared thread.
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+    if scope['type'] != 'http':
+        raise NotImplementedError(f"Unsupported ASGI scope type: {scope['type']}")
+
+    body = await _read_body(receive)
+    if body is None:
+        return  # The client went away before sending its request
+    environ = build_environ(scope, body)
+
+    view = _async_view(environ)
+    if view:
+        status, headers, chunks = await _serve_async(view, environ)
+    else:
+        status, headers, chunks = await asyncio.to_thread(_serve_wsgi, environ)
+
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]})
+    await send({'type': 'http.response.body', 'body': b''.join(chunks)})
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def _read_body(receive):
+    body = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        body.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(body)
+
+def build_environ(scope, body):
+    # The WSGI environ for an ASGI http scope (PEP 3333 names, headers joined like a WSGI server would)
+    script_name = scope.get('root_path', '')
+    path = scope['path']
+    if script_name and path.startswith(script_name):
+        path = path[len(script_name):]
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': script_name.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        # The whole body is already read, so it can be parsed without a Content-Length
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'], environ['REMOTE_PORT'] = scope['client'][0], str(scope['client'][1])
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        key = name if name in ('CONTENT_TYPE', 'CONTENT_LENGTH') else f"HTTP_{name}"
+        value = value.decode('latin-1')
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+def _async_view(environ):
+    # The view function if this request is routed to an async view, else None (including for routing errors,
+    # redirects and automatic OPTIONS, which the WSGI path answers)
+    if environ['REQUEST_METHOD'] == 'OPTIONS':
+        return None
+    try:
+        rule, _ = flask_app.url_map.bind_to_environ(environ).match(return_rule=True)
+    except (HTTPException, RequestRedirect):
+        return None
+    view = flask_app.view_functions.get(rule.endpoint)
+    return view if inspect.iscoroutinefunction(view) else None
+
+async def _serve_async(view, environ):
+    # Flask.wsgi_app and full_dispatch_request, with the view awaited instead of run to completion.
+    # Each ASGI request runs in its own task, so the request context pushed here is private to it.
+    environ[EVENT_LOOP_ENVIRON_KEY] = True
+    ctx = flask_app.request_context(environ)
+    error = None
+    try:
+        try:
+            ctx.push()
+            try:
+                request_started.send(flask_app, _async_wrapper=flask_app.ensure_sync)
+                rv = flask_app.preprocess_request()
+                if rv is None:
+                    rv = await view(**request.view_args)
+            except Exception as e:
+                rv = flask_app.handle_user_exception(e)
+            response = flask_app.finalize_request(rv)
+        except Exception as e:
+            error = e
+            response = flask_app.handle_exception(e)
+        except BaseException as e:
+            error = e
+            raise
+        chunks, status, headers = response.get_wsgi_response(environ)
+        try:
+            return int(status.split(' ', 1)[0]), headers, list(chunks)
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+    finally:
+        if error is not None and flask_app.should_ignore_error(error):
+            error = None
+        ctx.pop(error)
+
+def _serve_wsgi(environ):
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'], started['headers'] = status, headers
+
+    chunks = flask_app(environ, start_response)
+    try:
+        body = list(chunks)
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+    return int(started['status'].split(' ', 1)[0]), started['headers'], body
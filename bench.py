@@ -0,0 +1,185 @@
+import os
+import sys
+import time
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+import spotipy
+from stub_servers import start_spotify_stub
+from spotify_client import spotify_for_token, create_playlist_and_add_tracks, PlaylistStream
+
+# Micro-benchmarks for the export path. By default they run against the local stubs in stub_servers.py,
+# with --latency-ms / --handshake-ms standing in for the round trips to the real services.
+#   python bench.py spotify-pool > bench_output.txt
+#   python bench.py playlist-write --tracks 2000
+#   python bench.py stream-export --tracks 500 --page-ms 300
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+def report(label, samples, wall_s, extra=""):
+    print(f"{label:<22} n={len(samples):<4} mean {statistics.mean(samples) * 1000:8.1f}ms  "
+          f"p50 {percentile(samples, 50) * 1000:8.1f}ms  p95 {percentile(samples, 95) * 1000:8.1f}ms  "
+          f"wall {wall_s:6.2f}s  {extra}")
+
+def run_timed(fn, count, concurrency):
+    samples = []
+
+    def timed(_):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(timed, range(count)))
+    return samples, time.perf_counter() - start
+
+def bench_spotify_pool(args):
+    # One "request" = what a route does before writing: build a client, fetch the profile and the playlist list
+    if args.live:
+        token = os.environ.get("SPOTIFY_ACCESS_TOKEN")
+        if not token:
+            print("Error: --live needs SPOTIFY_ACCESS_TOKEN")
+            return 2
+        prefix = None
+        stub = None
+    else:
+        token = "bench-token"
+        stub = start_spotify_stub(latency_ms=args.latency_ms, handshake_ms=args.handshake_ms)
+        prefix = f"{stub.url}/v1/"
+        print(f"Spotify stub at {stub.url} (latency {args.latency_ms}ms, handshake {args.handshake_ms}ms)")
+
+    def make_request(client_factory):
+        def request():
+            sp = client_factory()
+            if prefix:
+                sp.prefix = prefix
+            sp.current_user()
+            sp.current_user_playlists(limit=50)
+        return request
+
+    variants = [
+        ('fresh session', lambda: spotipy.Spotify(auth=token)),
+        ('pooled session', lambda: spotify_for_token(token)),
+    ]
+
+    print(f"{args.requests} requests, concurrency {args.concurrency}\n")
+    results = {}
+    for label, factory in variants:
+        connections_before = stub.connections if stub else 0
+        # Warm-up so the pooled variant is measured in steady state, as it would be in a long-lived worker
+        make_request(factory)()
+        samples, wall_s = run_timed(make_request(factory), args.requests, args.concurrency)
+        extra = f"new connections {stub.connections - connections_before}" if stub else ""
+        report(label, samples, wall_s, extra)
+        results[label] = statistics.mean(samples)
+
+    saving = results['fresh session'] - results['pooled session']
+    print(f"\nPooled transport saves {saving * 1000:.1f}ms per request "
+          f"({saving / results['fresh session'] * 100:.0f}%)")
+
+    if stub:
+        stub.stop()
+    return 0
+
+def bench_playlist_write(args):
+    # Serial 100-track batches vs concurrent batches + ordering pass, for one large playlist
+    stub = start_spotify_stub(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms)
+    print(f"Spotify stub at {stub.url} (latency {args.latency_ms}ms, jitter {args.jitter_ms}ms), {args.tracks} tracks\n")
+    track_ids = [f"bench{i:05d}" for i in range(args.tracks)]
+    expected = [f"spotify:track:{tid}" for tid in track_ids]
+
+    results = {}
+    for label, parallel in (('serial batches', False), ('parallel batches', True)):
+        samples = []
+        requests_made = 0
+        for run in range(args.runs):
+            stub.state.clear()
+            sp = spotify_for_token("bench-token")
+            sp.prefix = f"{stub.url}/v1/"
+            requests_before = stub.requests
+            start = time.perf_counter()
+            create_playlist_and_add_tracks(sp, track_ids, f"bench-{run}", parallel=parallel)
+            samples.append(time.perf_counter() - start)
+            requests_made += stub.requests - requests_before
+            (playlist,) = stub.state.values()
+            if playlist['items'] != expected:
+                print(f"Error: {label} produced the wrong track order")
+                return 1
+        report(label, samples, sum(samples), f"requests/run {requests_made / args.runs:.1f}")
+        results[label] = statistics.mean(samples)
+
+    print(f"\nParallel write speedup: {results['serial batches'] / results['parallel batches']:.2f}x")
+    stub.stop()
+    return 0
+
+def bench_stream_export(args):
+    # Scrape-then-write vs the streaming pipeline. Pages of 50 tracks are produced every --page-ms,
+    # standing in for the paginated xmplaylist API.
+    stub = start_spotify_stub(latency_ms=args.latency_ms)
+    print(f"Spotify stub at {stub.url} (latency {args.latency_ms}ms), {args.tracks} tracks, "
+          f"page every {args.page_ms}ms\n")
+    track_ids = [f"bench{i:05d}" for i in range(args.tracks)]
+
+    def pages():
+        for start in range(0, len(track_ids), 50):
+            time.sleep(args.page_ms / 1000.0)
+            yield track_ids[start:start + 50]
+
+    def scrape_then_write(sp, name):
+        scraped = [tid for page in pages() for tid in page]
+        create_playlist_and_add_tracks(sp, scraped, name, parallel=False)
+
+    def streamed(sp, name):
+        playlist = PlaylistStream(sp, name)
+        for page in pages():
+            playlist.add(page)
+        playlist.finish()
+
+    results = {}
+    for label, export in (('scrape then write', scrape_then_write), ('streaming', streamed)):
+        samples = []
+        for run in range(args.runs):
+            stub.state.clear()
+            sp = spotify_for_token("bench-token")
+            sp.prefix = f"{stub.url}/v1/"
+            start = time.perf_counter()
+            export(sp, f"bench-{run}")
+            samples.append(time.perf_counter() - start)
+            (playlist,) = stub.state.values()
+            if playlist['items'] != [f"spotify:track:{tid}" for tid in track_ids]:
+                print(f"Error: {label} produced the wrong track order")
+                return 1
+        report(label, samples, sum(samples))
+        results[label] = statistics.mean(samples)
+
+    print(f"\nStreaming speedup: {results['scrape then write'] / results['streaming']:.2f}x")
+    stub.stop()
+    return 0
+
+SCENARIOS = {
+    'spotify-pool': bench_spotify_pool,
+    'playlist-write': bench_playlist_write,
+    'stream-export': bench_stream_export,
+}
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Benchmarks for the Sxmify export path.")
+    parser.add_argument('scenario', choices=sorted(SCENARIOS))
+    parser.add_argument('--requests', type=int, default=50, help="Requests per variant")
+    parser.add_argument('--concurrency', type=int, default=1, help="Concurrent requests")
+    parser.add_argument('--latency-ms', type=int, default=30, help="Stub latency per request")
+    parser.add_argument('--handshake-ms', type=int, default=60, help="Stub delay per new connection (TCP + TLS)")
+    parser.add_argument('--jitter-ms', type=int, default=40, help="Random extra stub latency per request")
+    parser.add_argument('--tracks', type=int, default=2000, help="Playlist length for playlist-write")
+    parser.add_argument('--page-ms', type=int, default=300, help="Simulated scrape time per 50-track page for stream-export")
+    parser.add_argument('--runs', type=int, default=3, help="Repetitions for playlist-write")
+    parser.add_argument('--live', action='store_true', help="Hit api.spotify.com instead of the stub")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    sys.exit(SCENARIOS[args.scenario](args))
@@ -0,0 +1,176 @@
+import os
+import time
+import threading
+import scraper
+from circuit_breaker import CircuitOpenError
+
+# In-process TTL cache for scrape results and the station catalog, plus a background warmer that
+# refreshes the most requested (station, mode, days) feeds shortly before they expire.
+# Each gunicorn worker keeps its own cache; on serverless hosts the warmer only runs while an instance is warm.
+
+SCRAPE_TTL = float(os.environ.get("SCRAPE_CACHE_TTL", "300"))
+STATIONS_TTL = float(os.environ.get("STATION_CACHE_TTL", "3600"))
+# Refresh entries that expire within this many seconds
+WARM_AHEAD = float(os.environ.get("CACHE_WARM_AHEAD", "60"))
+WARM_INTERVAL = float(os.environ.get("CACHE_WARM_INTERVAL", "30"))
+WARM_TOP_N = int(os.environ.get("CACHE_WARM_TOP_N", "10"))
+# A feed has to be requested about this often (decayed count) before the warmer spends upstream calls on it
+WARM_MIN_SCORE = float(os.environ.get("CACHE_WARM_MIN_SCORE", "2"))
+POPULARITY_HALF_LIFE = float(os.environ.get("CACHE_POPULARITY_HALF_LIFE", "3600"))
+WARMER_ENABLED = os.environ.get("CACHE_WARMER", "1").lower() not in ("0", "false", "no")
+
+STATIONS_KEY = 'stations'
+
+class ScrapeCache:
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        # key -> {'value', 'limit', 'expires_at', 'refreshed_at'}
+        self._entries = {}
+        # (station, mode, days) -> {'score', 'at', 'limit'}
+        self._popularity = {}
+
+    def get(self, key, limit=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if not entry or entry['expires_at'] <= self._clock():
+                return None
+            # A smaller scrape can't answer a bigger request, unless the feed simply had fewer tracks
+            if limit is not None and entry['limit'] < limit and len(entry['value']) >= entry['limit']:
+                return None
+            return entry['value'][:limit] if limit is not None else entry['value']
+
+    def set(self, key, value, ttl, limit=None):
+        now = self._clock()
+        with self._lock:
+            self._entries[key] = {'value': value, 'limit': limit, 'expires_at': now + ttl, 'refreshed_at': now}
+
+    def expires_in(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry['expires_at'] - self._clock() if entry else None
+
+    def age(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return self._clock() - entry['refreshed_at'] if entry else None
+
+    def record_request(self, key, limit):
+        # Exponentially decayed request count, so yesterday's hot station fades out
+        now = self._clock()
+        with self._lock:
+            stat = self._popularity.setdefault(key, {'score': 0.0, 'at': now, 'limit': limit})
+            stat['score'] = self._decayed(stat, now) + 1
+            stat['at'] = now
+            stat['limit'] = max(stat['limit'], limit)
+
+    def _decayed(self, stat, now):
+        return stat['score'] * 0.5 ** ((now - stat['at']) / POPULARITY_HALF_LIFE)
+
+    def hot_feeds(self, top_n=WARM_TOP_N, min_score=WARM_MIN_SCORE):
+        # [(key, limit, score)] most requested first
+        now = self._clock()
+        with self._lock:
+            ranked = [(key, stat['limit'], self._decayed(stat, now)) for key, stat in self._popularity.items()]
+        ranked = [r for r in ranked if r[2] >= min_score]
+        ranked.sort(key=lambda r: r[2], reverse=True)
+        return ranked[:top_n]
+
+    def warm_once(self):
+        # Refreshes the station catalog and the hot feeds that are missing or about to expire.
+        # Returns the keys that were refreshed.
+        refreshed = []
+        expiring = self.expires_in(STATIONS_KEY)
+        if expiring is None or expiring <= WARM_AHEAD:
+            stations = scraper.get_stations()
+            if stations:
+                self.set(STATIONS_KEY, stations, STATIONS_TTL)
+                refreshed.append(STATIONS_KEY)
+
+        for key, limit, score in self.hot_feeds():
+            expiring = self.expires_in(key)
+            if expiring is not None and expiring > WARM_AHEAD:
+                continue
+            station, mode, days = key
+            try:
+                tracks = scraper.scrape_tracks(scraper.build_scrape_url(station, mode, days), limit=limit)
+            except (CircuitOpenError, scraper.UpstreamError) as e:
+                print(f"Cache warmer paused: {e}")
+                break
+            if tracks:
+                self.set(key, tracks, SCRAPE_TTL, limit)
+                refreshed.append(key)
+        return refreshed
+
+    def snapshot(self):
+        now = self._clock()
+        with self._lock:
+            entries = {str(key): {'age_s': round(now - e['refreshed_at'], 1), 'expires_in_s': round(e['expires_at'] - now, 1)}
+                       for key, e in self._entries.items()}
+        return {'entries': entries,
+                'hot': [{'feed': list(key), 'limit': limit, 'score': round(score, 2)} for key, limit, score in self.hot_feeds()]}
+
+cache = ScrapeCache()
+_warmer_thread = None
+_warmer_lock = threading.Lock()
+
+def _feed_key(url):
+    target = scraper.parse_scrape_url(url)
+    if not target:
+        return None
+    station, mode, days = target
+    return station, mode, days if mode == 'most_heard' else None
+
+def get_stations():
+    stations = cache.get(STATIONS_KEY)
+    if stations is None:
+        stations = scraper.get_stations()
+        if stations:
+            cache.set(STATIONS_KEY, stations, STATIONS_TTL)
+    return stations
+
+async def get_stations_async():
+    stations = cache.get(STATIONS_KEY)
+    if stations is None:
+        stations = await scraper.get_stations_async()
+        if stations:
+            cache.set(STATIONS_KEY, stations, STATIONS_TTL)
+    return stations
+
+async def scrape_tracks_async(url, limit=60):
+    # Drop-in for scraper.scrape_tracks_async that serves warm results and feeds the popularity counts
+    key = _feed_key(url)
+    if key is None:
+        return await scraper.scrape_tracks_async(url, limit=limit)
+
+    cache.record_request(key, limit)
+    tracks = cache.get(key, limit)
+    if tracks is not None:
+        print(f"Cache hit: {key} (limit {limit})")
+        return tracks
+
+    tracks = await scraper.scrape_tracks_async(url, limit=limit)
+    if tracks:
+        cache.set(key, tracks, SCRAPE_TTL, limit)
+    return tracks
+
+def _warm_forever():
+    while True:
+        try:
+            refreshed = cache.warm_once()
+            if refreshed:
+                print(f"Cache warmer refreshed {len(refreshed)} entries: {refreshed}")
+        except Exception as e:
+            print(f"Cache warmer error: {e}")
+        time.sleep(WARM_INTERVAL)
+
+def start_warmer():
+    # Idempotent; called on the first request so importing the app never starts threads
+    global _warmer_thread
+    if not WARMER_ENABLED:
+        return
+    with _warmer_lock:
+        if _warmer_thread is None:
+            _warmer_thread = threading.Thread(target=_warm_forever, daemon=True, name="cache-warmer")
+            _warmer_thread.start()
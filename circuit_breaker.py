@@ -0,0 +1,118 @@
+import time
+import threading
+from collections import deque
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+class CircuitOpenError(Exception):
+    pass
+
+class CircuitBreaker:
+    # Tracks recent call outcomes for one upstream and fails fast once the error rate spikes.
+    # After the cooldown a single probe call is let through; success closes the circuit again.
+
+    def __init__(self, name, failure_threshold=0.5, min_calls=4, window_seconds=60, cooldown_seconds=30, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.cooldown_seconds = cooldown_seconds
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._calls = deque()  # (timestamp, succeeded)
+        self._state = CLOSED
+        self._opened_at = None
+        self._probe_in_flight = False
+        self.last_error = None
+        self.last_success_at = None
+        self.last_failure_at = None
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == OPEN and self.clock() - self._opened_at >= self.cooldown_seconds:
+            self._state = HALF_OPEN
+            self._probe_in_flight = False
+        return self._state
+
+    def _trim(self, now):
+        while self._calls and now - self._calls[0][0] > self.window_seconds:
+            self._calls.popleft()
+
+    def allow(self):
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def check(self):
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} is unavailable (circuit open, retrying in {self.retry_in():.0f}s)")
+
+    def retry_in(self):
+        with self._lock:
+            if self._state != OPEN:
+                return 0.0
+            return max(0.0, self.cooldown_seconds - (self.clock() - self._opened_at))
+
+    def record_success(self):
+        with self._lock:
+            now = self.clock()
+            self.last_success_at = now
+            if self._current_state() == HALF_OPEN:
+                print(f"Circuit '{self.name}' closed after successful probe")
+                self._state = CLOSED
+                self._calls.clear()
+            self._probe_in_flight = False
+            self._calls.append((now, True))
+            self._trim(now)
+
+    def record_failure(self, error=None):
+        with self._lock:
+            now = self.clock()
+            self.last_failure_at = now
+            self.last_error = str(error) if error else None
+            state = self._current_state()
+            self._calls.append((now, False))
+            self._trim(now)
+
+            if state == HALF_OPEN:
+                self._trip(now)
+                return
+
+            failures = sum(1 for _, ok in self._calls if not ok)
+            if state == CLOSED and len(self._calls) >= self.min_calls and failures / len(self._calls) >= self.failure_threshold:
+                self._trip(now)
+
+    def _trip(self, now):
+        print(f"Circuit '{self.name}' opened (last error: {self.last_error})")
+        self._state = OPEN
+        self._opened_at = now
+        self._probe_in_flight = False
+
+    def snapshot(self):
+        with self._lock:
+            now = self.clock()
+            self._trim(now)
+            total = len(self._calls)
+            failures = sum(1 for _, ok in self._calls if not ok)
+            return {
+                'name': self.name,
+                'state': self._current_state(),
+                'calls_in_window': total,
+                'error_rate': failures / total if total else 0.0,
+                'last_error': self.last_error,
+                'seconds_since_success': now - self.last_success_at if self.last_success_at is not None else None,
+                'seconds_since_failure': now - self.last_failure_at if self.last_failure_at is not None else None,
+                'retry_in': max(0.0, self.cooldown_seconds - (now - self._opened_at)) if self._state == OPEN else 0.0
+            }
@@ -0,0 +1,20 @@
+import pytest
+import state_store
+
+@pytest.fixture(autouse=True)
+def state_dir(tmp_path, monkeypatch):
+    # Every test gets its own empty state dir, so nothing reads or writes ./state
+    path = tmp_path / 'state'
+    monkeypatch.setattr(state_store, 'STATE_DIR', str(path))
+    return path
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock():
+    return FakeClock()
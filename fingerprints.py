@@ -0,0 +1,44 @@
+import os
+import time
+import hashlib
+from state_store import JsonStore
+
+# Re-sync anyway after this long, in case the playlist was edited or deleted on Spotify's side
+MAX_AGE_SECONDS = float(os.environ.get("EXPORT_FINGERPRINT_MAX_AGE", str(7 * 24 * 3600)))
+
+# {"<user>|<playlist name>": {"fingerprint", "playlist_url", "track_count", "exported_at"}}
+_store = JsonStore('export_fingerprints.json')
+
+def fingerprint(track_ids):
+    return hashlib.sha256("\n".join(track_ids).encode()).hexdigest()
+
+def _key(user_key, playlist_name):
+    return f"{user_key}|{playlist_name}"
+
+def unchanged_playlist_url(user_key, playlist_name, track_ids):
+    # Returns the playlist URL if the last export of this exact track sequence is still fresh.
+    # Fingerprints only save API calls, so if they can't be read the playlist is simply written.
+    try:
+        entry = _store.get(_key(user_key, playlist_name))
+    except OSError as e:
+        print(f"Warning: could not read export fingerprints: {e}")
+        return None
+    if not entry or entry.get('fingerprint') != fingerprint(track_ids):
+        return None
+    if time.time() - entry.get('exported_at', 0) > MAX_AGE_SECONDS:
+        return None
+    return entry.get('playlist_url')
+
+def record_export(user_key, playlist_name, track_ids, playlist_url):
+    def apply(data):
+        data[_key(user_key, playlist_name)] = {
+            'fingerprint': fingerprint(track_ids),
+            'playlist_url': playlist_url,
+            'track_count': len(track_ids),
+            'exported_at': time.time()
+        }
+    # Called after the playlist was written; failing to remember it must not fail the export
+    try:
+        _store.update(apply)
+    except OSError as e:
+        print(f"Warning: could not save export fingerprint: {e}")
@@ -0,0 +1,124 @@
+import os
+import time
+import threading
+import scraper
+import cache_warmer
+import station_health
+from circuit_breaker import OPEN
+from state_store import JsonStore
+
+# Health report built only from state the app already keeps: the upstream breaker, the scrape cache,
+# per-station results and cron checkpoints. It makes no upstream calls, so monitors can poll it freely.
+# Live upstream probes are separate, explicitly triggered and rate limited.
+
+# Minimum seconds between live probes (per process); earlier triggers get the last result back
+PROBE_MIN_INTERVAL = float(os.environ.get("HEALTH_PROBE_INTERVAL", "300"))
+PROBE_STATION = os.environ.get("HEALTH_PROBE_STATION", "siriusxmhits1")
+
+# {"<cron path>": {started_at, finished_at, duration_s, status, ok, results, failed, skipped, error, last_ok_at}}
+_cron_store = JsonStore('cron_checkpoints.json')
+
+_probe_lock = threading.Lock()
+_last_probe = None
+
+def record_cron_run(job, started_at, status, body):
+    # body is the cron route's JSON response; both cron routes return a 'results' list,
+    # and a ?merge= update adds the one playlist it wrote as 'merged'
+    now = time.time()
+    body = body if isinstance(body, dict) else {}
+    results = body.get('results') or []
+    failed = [r for r in results if r.get('error') and not r.get('skipped')]
+    merged = body.get('merged')
+    # A merged run's only output is that playlist; with every station backing off there was nothing to write
+    merged_failed = bool(merged) and not merged.get('success') and not (results and all(r.get('skipped') for r in results))
+    if merged_failed:
+        failed.insert(0, merged)
+    # One dead station doesn't fail the job; those show up per station
+    ok = status < 400 and not merged_failed and not (results and len(failed) == len(results))
+
+    def apply(data):
+        entry = data.setdefault(job, {})
+        entry.update({
+            'started_at': started_at,
+            'finished_at': now,
+            'duration_s': round(now - started_at, 2),
+            'status': status,
+            'ok': ok,
+            'results': len(results),
+            'failed': len(failed),
+            'skipped': sum(1 for r in results if r.get('skipped')),
+            'error': body.get('error') or (failed[0]['error'] if failed else None)
+        })
+        if ok:
+            entry['last_ok_at'] = now
+    _cron_store.update(apply)
+
+def _ago(timestamp, now):
+    return round(now - timestamp) if timestamp else None
+
+def cron_snapshot():
+    now = time.time()
+    return {job: {'last_run_s_ago': _ago(entry.get('finished_at'), now),
+                  'last_ok_s_ago': _ago(entry.get('last_ok_at'), now),
+                  **{k: entry.get(k) for k in ('duration_s', 'status', 'ok', 'results', 'failed', 'skipped', 'error')}}
+            for job, entry in _cron_store.read().items()}
+
+def report():
+    breaker = scraper.xmplaylist_breaker.snapshot()
+    cron = cron_snapshot()
+    problems = []
+    if breaker['state'] == OPEN:
+        problems.append(f"xmplaylist.com breaker open: {breaker['last_error']}")
+    problems += [f"last {job} run failed: {entry['error']}" for job, entry in cron.items() if entry['ok'] is False]
+
+    return {
+        'status': 'degraded' if problems else 'ok',
+        'problems': problems,
+        'upstream': breaker,
+        'cron': cron,
+        'cache': cache_warmer.cache.snapshot(),
+        'stations': station_health.snapshot(),
+        'last_probe': {'s_ago': _ago(_last_probe['at'], time.time()), 'ok': _last_probe['ok']} if _last_probe else None
+    }
+
+def _check(name, func, checks):
+    start = time.perf_counter()
+    try:
+        checks[name] = func()
+    except Exception as e:
+        checks[name] = {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+    checks[name]['elapsed_ms'] = round((time.perf_counter() - start) * 1000)
+
+def _probe_upstream():
+    # The same calls the app makes, so they go through the breaker and respect XMPLAYLIST_BASE_URL
+    checks = {}
+
+    def stations():
+        found = scraper.get_stations()
+        return {'ok': bool(found), 'count': len(found)}
+
+    def tracks():
+        found = scraper.scrape_tracks(scraper.build_scrape_url(PROBE_STATION), limit=10)
+        return {'ok': bool(found), 'count': len(found), 'sample': found[0] if found else None}
+
+    def api():
+        url, params, _ = scraper.api_endpoint(PROBE_STATION, 'recent')
+        resp = scraper.upstream_get(url, params)
+        return {'ok': resp.status_code == 200, 'url': url, 'status_code': resp.status_code, 'preview': resp.text[:300]}
+
+    _check('stations', stations, checks)
+    _check('tracks', tracks, checks)
+    _check('api', api, checks)
+    return {'ok': all(c['ok'] for c in checks.values()), 'station': PROBE_STATION, 'checks': checks}
+
+def run_probe():
+    # Returns (result, retry_in). Only one probe runs at a time, and at most one per PROBE_MIN_INTERVAL;
+    # inside the interval the last result is returned with the seconds until the next probe is allowed.
+    global _last_probe
+    with _probe_lock:
+        now = time.time()
+        if _last_probe and now - _last_probe['at'] < PROBE_MIN_INTERVAL:
+            return _last_probe, PROBE_MIN_INTERVAL - (now - _last_probe['at'])
+        _last_probe = {'at': now, **_probe_upstream()}
+        print(f"Upstream probe: {'ok' if _last_probe['ok'] else 'FAILED'}")
+        return _last_probe, 0
@@ -0,0 +1,255 @@
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import datetime
+import tempfile
+import threading
+import subprocess
+import requests
+from flask import Flask
+from flask.sessions import SecureCookieSessionInterface
+from stub_servers import start_xmplaylist_stub, start_spotify_stub
+from bench import percentile
+
+# Load test for the web routes, run under the Procfile's gunicorn command against the local stand-ins
+# for xmplaylist.com and Spotify in stub_servers.py. Each route is driven at every concurrency level in
+# turn; results are saved as JSON so runs can be compared between commits.
+#   python loadtest.py --levels 1,8,32 --duration 10
+#   python loadtest.py --compare loadtest_results/20260101-120000-abc1234.json
+
+ROUTES = ('/', '/scrape', '/review', '/export')
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "loadtest_results")
+SECRET_KEY = "loadtest-secret"
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def procfile_command():
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "Procfile")) as f:
+        for line in f:
+            if line.startswith("web:"):
+                return line[len("web:"):].strip()
+    raise RuntimeError("No web: entry in Procfile")
+
+def session_cookie(data):
+    # Sign a session the same way the app does, so load users start logged in / mid-flow
+    app = Flask("loadtest", root_path=".")
+    app.secret_key = SECRET_KEY
+    return SecureCookieSessionInterface().get_signing_serializer(app).dumps(data)
+
+class Target:
+    # Builds the request for each route. Stations are picked with a skewed distribution, like real users.
+
+    def __init__(self, base_url, xmplaylist, timeout):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.station_urls = [f"{xmplaylist.url}/station/{sid}" for sid in xmplaylist.stations]
+        self.weights = [1.0 / rank for rank in range(1, len(self.station_urls) + 1)]
+        self.logged_in = session_cookie({'token_info': {
+            'access_token': 'loadtest', 'refresh_token': 'loadtest', 'token_type': 'Bearer',
+            'scope': 'playlist-modify-public playlist-modify-private', 'expires_at': int(time.time()) + 86400
+        }})
+
+    def station(self):
+        return random.choices(self.station_urls, self.weights)[0]
+
+    def request(self, http, route):
+        # Returns (ok, status)
+        url = self.base_url + route
+        if route == '/':
+            resp = http.get(url, timeout=self.timeout)
+            return resp.ok and 'station-option' in resp.text, resp.status_code
+        if route == '/scrape':
+            resp = http.post(url, data={'url': self.station(), 'scrape_type': 'recent', 'limit': '100', 'station_name': 'Load'},
+                             timeout=self.timeout)
+            return resp.ok and 'name="track_ids"' in resp.text, resp.status_code
+        if route == '/review':
+            cookie = session_cookie({'last_scrape': {'url': self.station(), 'station_name': 'Load', 'scrape_type': 'recent',
+                                                     'days': '7', 'limit': 100}})
+            resp = http.get(url, cookies={'spotify-login-session': cookie}, timeout=self.timeout)
+            return resp.ok and 'name="track_ids"' in resp.text, resp.status_code
+        if route == '/export':
+            station = self.station().rsplit('/', 1)[-1]
+            track_ids = [f"{station}{i:05d}" for i in range(100)]
+            resp = http.post(url, data={'track_ids': track_ids, 'station_id': station, 'scrape_type': 'recent'},
+                             cookies={'spotify-login-session': self.logged_in}, allow_redirects=False, timeout=self.timeout)
+            return resp.ok and 'Open in Spotify' in resp.text, resp.status_code
+        raise ValueError(route)
+
+def run_stage(target, route, concurrency, duration):
+    samples = []
+    errors = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def user():
+        http = requests.Session()
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                ok, status = target.request(http, route)
+            except requests.RequestException as e:
+                ok, status = False, type(e).__name__
+            elapsed = time.perf_counter() - start
+            with lock:
+                samples.append(elapsed)
+                if not ok:
+                    errors.append(status)
+
+    start = time.perf_counter()
+    users = [threading.Thread(target=user) for _ in range(concurrency)]
+    for u in users:
+        u.start()
+    for u in users:
+        u.join()
+    wall_s = time.perf_counter() - start
+
+    return {
+        'route': route,
+        'concurrency': concurrency,
+        'requests': len(samples),
+        'errors': len(errors),
+        'error_rate': round(len(errors) / len(samples), 4) if samples else 1.0,
+        'error_statuses': sorted(set(map(str, errors))),
+        'rps': round(len(samples) / wall_s, 2),
+        'p50_ms': round(percentile(samples, 50) * 1000, 1) if samples else None,
+        'p95_ms': round(percentile(samples, 95) * 1000, 1) if samples else None,
+        'p99_ms': round(percentile(samples, 99) * 1000, 1) if samples else None
+    }
+
+def start_app(port, env, log_path):
+    command = f"{procfile_command()} --bind 127.0.0.1:{port}"
+    print(f"Starting: {command}")
+    log = open(log_path, 'w')
+    proc = subprocess.Popen(command, shell=True, env=env, stdout=log, stderr=subprocess.STDOUT,
+                            cwd=os.path.dirname(os.path.abspath(__file__)), start_new_session=True)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"App exited with {proc.returncode}; see {log_path}")
+        try:
+            requests.get(f"http://127.0.0.1:{port}/", timeout=5)
+            return proc
+        except requests.RequestException:
+            time.sleep(0.2)
+    stop_app(proc)
+    raise RuntimeError(f"App did not start within 30s; see {log_path}")
+
+def stop_app(proc):
+    try:
+        os.killpg(proc.pid, 15)
+    except ProcessLookupError:
+        pass
+    proc.wait(timeout=30)
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def print_table(results, previous=None):
+    before = {(r['route'], r['concurrency']): r for r in previous['results']} if previous else {}
+    print(f"\n{'route':<9} {'conc':>5} {'reqs':>6} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for r in results:
+        line = (f"{r['route']:<9} {r['concurrency']:>5} {r['requests']:>6} {r['rps']:>8.1f} {r['p50_ms'] or 0:>8.1f} "
+                f"{r['p95_ms'] or 0:>8.1f} {r['p99_ms'] or 0:>8.1f} {r['error_rate'] * 100:>6.1f}%")
+        old = before.get((r['route'], r['concurrency']))
+        if old and old['rps'] and old['p95_ms']:
+            line += (f"   vs {previous['commit']}: rps {(r['rps'] / old['rps'] - 1) * 100:+.0f}%, "
+                     f"p95 {(r['p95_ms'] / old['p95_ms'] - 1) * 100:+.0f}%")
+        if r['error_statuses']:
+            line += f"   ({', '.join(r['error_statuses'])})"
+        print(line)
+
+def run(args):
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+
+    xmplaylist = start_xmplaylist_stub(latency_ms=args.xm_latency_ms, jitter_ms=args.jitter_ms)
+    spotify = start_spotify_stub(latency_ms=args.spotify_latency_ms, jitter_ms=args.jitter_ms)
+    port = free_port()
+    state_dir = tempfile.mkdtemp(prefix="sxmify-loadtest-")
+    env = dict(os.environ,
+               XMPLAYLIST_BASE_URL=xmplaylist.url,
+               SPOTIFY_API_PREFIX=f"{spotify.url}/v1/",
+               FLASK_SECRET_KEY=SECRET_KEY,
+               SPOTIPY_CLIENT_ID="loadtest",
+               SPOTIPY_CLIENT_SECRET="loadtest",
+               SXMIFY_STATE_DIR=state_dir)
+    if args.no_cache:
+        env.update(SCRAPE_CACHE_TTL="0", STATION_CACHE_TTL="0", CACHE_WARMER="0")
+
+    print(f"xmplaylist stub {xmplaylist.url} ({args.xm_latency_ms}ms), Spotify stub {spotify.url} ({args.spotify_latency_ms}ms)")
+    proc = start_app(port, env, os.path.join(state_dir, "app.log"))
+    target = Target(f"http://127.0.0.1:{port}", xmplaylist, args.timeout)
+
+    results = []
+    try:
+        for concurrency in args.levels:
+            for route in args.routes:
+                r = run_stage(target, route, concurrency, args.duration)
+                print(f"{route:<9} x{concurrency:<4} {r['rps']:7.1f} req/s  p95 {r['p95_ms']}ms  errors {r['error_rate'] * 100:.1f}%")
+                results.append(r)
+    finally:
+        stop_app(proc)
+        xmplaylist.stop()
+        spotify.stop()
+
+    commit = git_commit()
+    report = {
+        'commit': commit,
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'config': {
+            'command': procfile_command(),
+            'levels': args.levels,
+            'duration_s': args.duration,
+            'xm_latency_ms': args.xm_latency_ms,
+            'spotify_latency_ms': args.spotify_latency_ms,
+            'jitter_ms': args.jitter_ms,
+            'cache': not args.no_cache,
+            'env': {k: os.environ[k] for k in ('WEB_CONCURRENCY', 'BULK_CONCURRENCY', 'SPOTIFY_POOL_MAXSIZE') if k in os.environ}
+        },
+        'results': results
+    }
+    print_table(results, previous)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(args.output_dir, f"{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}-{commit}.json")
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved {path}")
+
+    return 0 if all(r['error_rate'] <= args.max_error_rate for r in results) else 1
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Concurrency load test for the Sxmify web routes.")
+    parser.add_argument('--levels', type=lambda v: [int(x) for x in v.split(',')], default=[1, 8, 32],
+                        help="Comma-separated concurrency levels")
+    parser.add_argument('--routes', type=lambda v: v.split(','), default=list(ROUTES), help="Comma-separated routes")
+    parser.add_argument('--duration', type=float, default=10, help="Seconds per route and level")
+    parser.add_argument('--xm-latency-ms', type=int, default=80, help="xmplaylist stub latency per request")
+    parser.add_argument('--spotify-latency-ms', type=int, default=60, help="Spotify stub latency per request")
+    parser.add_argument('--jitter-ms', type=int, default=20, help="Random extra stub latency per request")
+    parser.add_argument('--timeout', type=float, default=60, help="Client timeout per request")
+    parser.add_argument('--no-cache', action='store_true', help="Disable the scrape/station cache and warmer")
+    parser.add_argument('--max-error-rate', type=float, default=0.01, help="Exit non-zero above this error rate")
+    parser.add_argument('--output-dir', default=RESULTS_DIR)
+    parser.add_argument('--compare', help="Earlier results file to compare against")
+    args = parser.parse_args(argv)
+    unknown = set(args.routes) - set(ROUTES)
+    if unknown:
+        parser.error(f"unknown routes: {', '.join(sorted(unknown))}")
+    return args
+
+if __name__ == "__main__":
+    sys.exit(run(parse_args(sys.argv[1:])))
@@ -1,11 +1,29 @@
 import os
+import sys
+import json
+import time
+import argparse
 import getpass
+from urllib.parse import urlparse, parse_qs
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
-from scraper import scrape_tracks
-from spotify_client import get_spotify_client, create_playlist_and_add_tracks
+from scraper import scrape_tracks, get_stations, build_scrape_url, iter_track_pages
+from spotify_client import get_spotify_client, get_spotify_client_from_refresh_token, create_playlist_and_add_tracks, PlaylistStream
 
 load_dotenv()
 
+VALID_MODES = ('recent', 'newest', 'most_heard')
+
+def extract_station_id(url):
+    station_id = "unknown"
+    try:
+        parts = url.split('?')[0].rstrip('/').split('/')
+        if 'station' in parts:
+            station_id = parts[parts.index('station') + 1]
+    except Exception:
+        pass
+    return station_id
+
 def main():
     print("--- XM Playlist to Spotify Exporter ---")
     
@@ -16,13 +34,7 @@ def main():
         return
         
     # Extract station_id
-    station_id = "unknown"
-    try:
-        parts = url.rstrip('/').split('/')
-        if 'station' in parts:
-            station_id = parts[parts.index('station') + 1]
-    except Exception:
-        pass
+    station_id = extract_station_id(url)
         
     print("Scraping...")
     tracks = scrape_tracks(url)
@@ -50,5 +62,211 @@ def main():
     except Exception as e:
         print(f"Error: {e}")
 
+def load_jobs(path):
+    # One JSON object per line: {"station" or "url", "mode", "days", "limit", "name"}
+    jobs = []
+    with open(path) as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                job = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"{path}:{line_no}: invalid JSON ({e})")
+            if not job.get('station') and not job.get('url'):
+                raise ValueError(f"{path}:{line_no}: job needs a 'station' or 'url'")
+            jobs.append(job)
+    return jobs
+
+def normalize_job(job, defaults):
+    mode = job.get('mode', defaults['mode'])
+    days = job.get('days', defaults['days'])
+    station = job.get('station')
+
+    url = job.get('url')
+    if url:
+        # A full URL carries its own mode (and days) when it points at a sub-page
+        station = extract_station_id(url)
+        parsed = urlparse(url)
+        if parsed.path.rstrip('/').endswith('/newest'):
+            mode = 'newest'
+        elif parsed.path.rstrip('/').endswith('/most-heard'):
+            mode = 'most_heard'
+            days = parse_qs(parsed.query).get('days', [days])[0]
+
+    if mode not in VALID_MODES:
+        raise ValueError(f"Unknown mode '{mode}' (expected one of {', '.join(VALID_MODES)})")
+    if not station or station == "unknown":
+        raise ValueError(f"Could not determine station for job {job}")
+    if mode == 'most_heard' and not days:
+        days = 7
+
+    return {
+        'url': build_scrape_url(station, mode, days),
+        'station_id': station,
+        'mode': mode,
+        'days': str(days) if mode == 'most_heard' else None,
+        'limit': int(job.get('limit', defaults['limit'])),
+        'name': job.get('name')
+    }
+
+def run_job(sp, job, station_names, user_key=None, stream=False):
+    result = {
+        'station': job['station_id'],
+        'mode': job['mode'],
+        'success': False,
+        'track_count': 0,
+        'playlist_url': None,
+        'error': None,
+        'scrape_s': 0.0,
+        'export_s': 0.0
+    }
+
+    start = time.perf_counter()
+    if stream:
+        return stream_job(sp, job, station_names, user_key, result, start)
+    try:
+        tracks = scrape_tracks(job['url'], limit=job['limit'])
+        result['scrape_s'] = time.perf_counter() - start
+
+        track_ids = [t['id'] for t in tracks if 'id' in t]
+        if not track_ids:
+            result['error'] = "No tracks found"
+            return result
+        result['track_count'] = len(track_ids)
+
+        export_start = time.perf_counter()
+        result['playlist_url'] = create_playlist_and_add_tracks(
+            sp, track_ids, job['station_id'], job['mode'], job['days'],
+            station_names.get(job['station_id']), job['name'], user_key=user_key
+        )
+        result['export_s'] = time.perf_counter() - export_start
+        result['success'] = True
+    except Exception as e:
+        result['error'] = str(e)
+    finally:
+        result['total_s'] = time.perf_counter() - start
+
+    return result
+
+def stream_job(sp, job, station_names, user_key, result, start):
+    # Playlist lookup and batch writes overlap the page fetches; export_s is only the wait after the last page
+    playlist = PlaylistStream(sp, job['station_id'], job['mode'], job['days'],
+                              station_names.get(job['station_id']), job['name'], user_key=user_key)
+    try:
+        try:
+            for tracks in iter_track_pages(job['url'], limit=job['limit']):
+                playlist.add([t['id'] for t in tracks if 'id' in t])
+        except Exception:
+            playlist.abort()
+            raise
+        result['scrape_s'] = time.perf_counter() - start
+
+        export_start = time.perf_counter()
+        result['playlist_url'] = playlist.finish()
+        result['export_s'] = time.perf_counter() - export_start
+        result['track_count'] = len(playlist.track_ids)
+        if not playlist.track_ids:
+            result['error'] = "No tracks found"
+        else:
+            result['success'] = True
+    except Exception as e:
+        result['error'] = str(e)
+    finally:
+        result['total_s'] = time.perf_counter() - start
+
+    return result
+
+def print_summary(results, wall_s):
+    print("\n--- Batch Summary ---")
+    for r in results:
+        status = "OK  " if r['success'] else "FAIL"
+        detail = r['playlist_url'] if r['success'] else r['error']
+        print(f"{status} {r['station']:<24} {r['mode']:<10} {r['track_count']:>5} tracks  "
+              f"scrape {r['scrape_s']:6.2f}s  export {r['export_s']:6.2f}s  total {r['total_s']:6.2f}s  {detail}")
+
+    succeeded = sum(1 for r in results if r['success'])
+    total_tracks = sum(r['track_count'] for r in results if r['success'])
+    busy_s = sum(r['total_s'] for r in results)
+    print(f"\nJobs: {len(results)} ({succeeded} ok, {len(results) - succeeded} failed)")
+    print(f"Wall time: {wall_s:.2f}s (sum of job times {busy_s:.2f}s, {busy_s / wall_s if wall_s else 0:.1f}x overlap)")
+    print(f"Throughput: {len(results) / wall_s * 60 if wall_s else 0:.1f} jobs/min, "
+          f"{total_tracks / wall_s if wall_s else 0:.1f} tracks/s")
+
+def batch(args):
+    defaults = {'mode': args.mode, 'days': args.days, 'limit': args.limit}
+
+    try:
+        raw_jobs = load_jobs(args.jobs) if args.jobs else []
+        raw_jobs.extend({'url' if u.startswith('http') else 'station': u} for u in args.urls)
+        jobs = [normalize_job(job, defaults) for job in raw_jobs]
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        return 2
+
+    if not jobs:
+        print("No jobs to run.")
+        return 2
+
+    client_id = os.environ.get("SPOTIPY_CLIENT_ID")
+    client_secret = os.environ.get("SPOTIPY_CLIENT_SECRET")
+    refresh_token = os.environ.get("SPOTIPY_REFRESH_TOKEN")
+
+    if not client_id or not client_secret:
+        print("Error: SPOTIPY_CLIENT_ID and SPOTIPY_CLIENT_SECRET must be set in .env")
+        return 2
+
+    if refresh_token:
+        sp = get_spotify_client_from_refresh_token(client_id, client_secret, refresh_token)
+    else:
+        sp = get_spotify_client(client_id, client_secret)
+
+    # Authenticate once up front so workers don't race to refresh the token
+    try:
+        user_id = sp.current_user()['id']
+        print(f"Authenticated as {user_id}")
+    except Exception as e:
+        print(f"Error: Spotify authentication failed: {e}")
+        return 2
+
+    station_names = {}
+    if not args.no_station_names:
+        station_names = {s['id']: s['name'] for s in get_stations()}
+
+    print(f"Running {len(jobs)} jobs with {args.workers} workers...")
+    start = time.perf_counter()
+    results = []
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(run_job, sp, job, station_names, None if args.force else user_id, args.stream) for job in jobs]
+        for future in as_completed(futures):
+            r = future.result()
+            print(f"[{len(results) + 1}/{len(jobs)}] {r['station']} ({r['mode']}): "
+                  f"{'ok' if r['success'] else r['error']} in {r['total_s']:.2f}s")
+            results.append(r)
+    wall_s = time.perf_counter() - start
+
+    # Report in submission order, not completion order
+    results = [f.result() for f in futures]
+    print_summary(results, wall_s)
+
+    return 0 if all(r['success'] for r in results) else 1
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Export XM Playlist stations to Spotify playlists.")
+    parser.add_argument('urls', nargs='*', help="Station URLs or station ids (runs non-interactively)")
+    parser.add_argument('--jobs', help="JSONL job file, one {station|url, mode, days, limit, name} per line")
+    parser.add_argument('--mode', default='recent', choices=VALID_MODES, help="Default scrape mode for jobs")
+    parser.add_argument('--days', default=None, help="Default timeframe for most_heard jobs")
+    parser.add_argument('--limit', type=int, default=100, help="Default track limit per job")
+    parser.add_argument('--workers', type=int, default=4, help="Number of jobs to run concurrently")
+    parser.add_argument('--force', action='store_true', help="Rewrite playlists even if the tracks are unchanged since the last export")
+    parser.add_argument('--stream', action='store_true', help="Write each 100-track batch while later pages are still being scraped")
+    parser.add_argument('--no-station-names', action='store_true', help="Skip the station list fetch used for playlist names")
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    if args.urls or args.jobs:
+        sys.exit(batch(args))
     main()
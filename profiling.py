@@ -0,0 +1,208 @@
+import os
+import sys
+import time
+import uuid
+import random
+import datetime
+import functools
+import contextlib
+import threading
+import contextvars
+from collections import Counter
+from state_store import JsonStore, STATE_DIR
+
+# Opt-in sampling profiler for requests and cron runs.
+# While a run is profiled, a sampler thread records the stacks of the threads working on it every
+# PROFILE_INTERVAL_MS: the request thread and the pool threads it hands work to through in_profile().
+# Waiting on the network shows up as time in the socket/selector frames. Each run is saved as a
+# folded-stack file (flamegraph.pl / speedscope format), and the index keeps the slowest recent runs.
+
+# Fraction of ordinary requests / cron runs to profile (0 disables sampling; the header still works)
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_CRON_SAMPLE_RATE = float(os.environ.get("PROFILE_CRON_SAMPLE_RATE", str(PROFILE_SAMPLE_RATE)))
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(STATE_DIR, "profiles"))
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", "100"))
+MAX_STACK_DEPTH = 64
+
+# {"runs": [{id, label, kind, started_at, duration_s, samples, status, file, top}]}
+_index = JsonStore('profile_index.json', default={'runs': []})
+
+_current = contextvars.ContextVar('profile', default=None)
+_active = set()
+_active_lock = threading.Lock()
+# Set while _active is non-empty; the sampler sleeps on it instead of polling when nothing is profiled
+_has_active = threading.Event()
+_sampler_thread = None
+
+class Profile:
+
+    def __init__(self, label, kind='request'):
+        self.id = datetime.datetime.now().strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+        self.label = label
+        self.kind = kind
+        self.samples = Counter()
+        self.threads = Counter()
+        self.owner = threading.get_ident()
+        self.started_at = datetime.datetime.now().isoformat(timespec='seconds')
+        self._start = time.perf_counter()
+        self.duration_s = None
+
+    def add_thread(self, ident=None):
+        with _active_lock:
+            self.threads[ident or threading.get_ident()] += 1
+
+    def remove_thread(self, ident=None):
+        ident = ident or threading.get_ident()
+        with _active_lock:
+            self.threads[ident] -= 1
+            if self.threads[ident] <= 0:
+                del self.threads[ident]
+
+    def stop(self):
+        self.duration_s = time.perf_counter() - self._start
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def _stack(frame):
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+def _sample_forever():
+    interval = PROFILE_INTERVAL_MS / 1000.0
+    while True:
+        _has_active.wait()
+        time.sleep(interval)
+        with _active_lock:
+            if not _active:
+                continue
+            frames = sys._current_frames()
+            for profile in _active:
+                for ident in profile.threads:
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        profile.samples[_stack(frame)] += 1
+
+def _ensure_sampler():
+    global _sampler_thread
+    with _active_lock:
+        if _sampler_thread is None:
+            _sampler_thread = threading.Thread(target=_sample_forever, daemon=True, name="profile-sampler")
+            _sampler_thread.start()
+
+def should_profile(kind, forced=False):
+    if forced:
+        return True
+    rate = PROFILE_CRON_SAMPLE_RATE if kind == 'cron' else PROFILE_SAMPLE_RATE
+    return rate > 0 and random.random() < rate
+
+def start(label, kind='request'):
+    # Profiles the calling thread (and the threads it hands work to) until finish(); returns a token for finish()
+    _ensure_sampler()
+    profile = Profile(label, kind)
+    profile.add_thread()
+    with _active_lock:
+        _active.add(profile)
+        _has_active.set()
+    return profile, _current.set(profile)
+
+def finish(started, status=None):
+    profile, token = started
+    try:
+        _current.reset(token)
+    except ValueError:
+        # Finished from a different context than it was started in
+        _current.set(None)
+    profile.remove_thread()
+    with _active_lock:
+        _active.discard(profile)
+        if not _active:
+            _has_active.clear()
+    profile.stop()
+    try:
+        save(profile, status)
+    except OSError as e:
+        print(f"Warning: could not save profile {profile.id}: {e}")
+    return profile
+
+def top_functions(samples, n=10):
+    # Leaf frames by share of samples: where the time actually went
+    leaves = Counter()
+    for stack, count in samples.items():
+        leaves[stack.rsplit(';', 1)[-1]] += count
+    total = sum(leaves.values()) or 1
+    return [{'function': name, 'pct': round(count * 100.0 / total, 1)} for name, count in leaves.most_common(n)]
+
+def save(profile, status=None):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"{profile.id}.folded")
+    with open(path, 'w') as f:
+        for stack, count in profile.samples.most_common():
+            f.write(f"{stack} {count}\n")
+
+    entry = {
+        'id': profile.id,
+        'label': profile.label,
+        'kind': profile.kind,
+        'started_at': profile.started_at,
+        'duration_s': round(profile.duration_s, 3),
+        'samples': sum(profile.samples.values()),
+        'status': status,
+        'file': path,
+        'top': top_functions(profile.samples)
+    }
+
+    def apply(data):
+        data['runs'].append(entry)
+        dropped = data['runs'][:-PROFILE_KEEP] if len(data['runs']) > PROFILE_KEEP else []
+        data['runs'] = data['runs'][-PROFILE_KEEP:]
+        return dropped
+    for old in _index.update(apply):
+        try:
+            os.remove(old['file'])
+        except OSError:
+            pass
+    print(f"Profile saved: {profile.label} {entry['duration_s']}s, {entry['samples']} samples -> {path}")
+    return entry
+
+def slowest_runs(limit=20, kind=None):
+    runs = _index.read()['runs']
+    if kind:
+        runs = [r for r in runs if r['kind'] == kind]
+    return sorted(runs, key=lambda r: r['duration_s'], reverse=True)[:limit]
+
+def get_run(profile_id):
+    return next((r for r in _index.read()['runs'] if r['id'] == profile_id), None)
+
+@contextlib.contextmanager
+def handed_off():
+    # The calling thread only waits on in_profile() workers meanwhile; leave it out so samples show their work
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    profile.remove_thread()
+    try:
+        yield
+    finally:
+        profile.add_thread()
+
+def in_profile(func):
+    # Wraps func for a thread pool so the worker threads are sampled as part of the caller's profile
+    profile = _current.get()
+    if profile is None:
+        return func
+
+    @functools.wraps(func)
+    def run(*args, **kwargs):
+        profile.add_thread()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.remove_thread()
+    return run
@@ -1,26 +1,148 @@
-from curl_cffi import requests
+from curl_cffi.requests import AsyncSession
 from bs4 import BeautifulSoup
 import re
 import json
 import os
+import asyncio
 
 from urllib.parse import urlparse, parse_qs
 
+from circuit_breaker import CircuitBreaker, CircuitOpenError
 
+# Every xmplaylist call is a coroutine. The async views and the ASGI app await them directly; the plain
+# functions (get_stations, scrape_tracks, iter_track_pages, ...) run the same code on a private event loop
+# for the CLI, the cache warmer and the other sync callers.
+
+# One breaker for the whole xmplaylist.com upstream: when it blocks us, every station is affected
+xmplaylist_breaker = CircuitBreaker('xmplaylist.com')
+
+# Point at a stand-in (e.g. the stub in stub_servers.py) for load tests
+XMPLAYLIST_BASE_URL = os.environ.get("XMPLAYLIST_BASE_URL", "https://xmplaylist.com").rstrip('/')
+
+REQUEST_TIMEOUT = float(os.environ.get("XMPLAYLIST_TIMEOUT", "15"))
+# Fire a duplicate API request if the first hasn't answered after this many seconds (0 disables)
+HEDGE_DELAY = float(os.environ.get("XMPLAYLIST_HEDGE_DELAY", "0"))
+
+# Spotify coverage of the last live scrape per (station, mode), in memory only; bulk and cron runs persist it
+_last_coverage = {}
+
+class UpstreamError(Exception):
+    # xmplaylist.com itself failed (blocked us, errored or was unreachable), as opposed to the feed being empty.
+    # Like CircuitOpenError it says nothing about the station.
+    pass
+
+def _is_upstream_failure(status_code):
+    # Blocks (403/429) and server errors count against the breaker; 404 etc. are the caller's problem
+    return status_code in (403, 429) or status_code >= 500
+
+def _iterate(agen):
+    # Drives an async generator from sync code on a private event loop, one item at a time
+    loop = asyncio.new_event_loop()
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(agen.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        loop.run_until_complete(agen.aclose())
+        loop.close()
+
+async def _get(url, params=None):
+    # A session per call, like curl_cffi's requests.get; it is bound to the running loop
+    async with AsyncSession() as session:
+        return await session.get(url, params=params, impersonate="chrome", timeout=REQUEST_TIMEOUT)
+
+async def upstream_get_async(url, params=None):
+    xmplaylist_breaker.check()
+    try:
+        resp = await _get(url, params)
+    except Exception as e:
+        xmplaylist_breaker.record_failure(e)
+        raise
+
+    _record_outcome(resp, url)
+    return resp
+
+def upstream_get(url, params=None):
+    return asyncio.run(upstream_get_async(url, params))
+
+async def upstream_get_json_async(url, params=None, hedge=False):
+    # Returns (status_code, data). A 200 that isn't JSON is usually a bot-check page, so it counts as a failure too.
+    xmplaylist_breaker.check()
+    try:
+        if hedge and HEDGE_DELAY > 0:
+            resp = await _hedged_get(url, params)
+        else:
+            resp = await _get(url, params)
+        data = resp.json() if resp.status_code == 200 else None
+    except Exception as e:
+        xmplaylist_breaker.record_failure(e)
+        raise
+
+    _record_outcome(resp, url)
+    return resp.status_code, data
+
+def upstream_get_json(url, params=None, hedge=False):
+    return asyncio.run(upstream_get_json_async(url, params, hedge))
+
+def _record_outcome(resp, url):
+    if _is_upstream_failure(resp.status_code):
+        xmplaylist_breaker.record_failure(f"HTTP {resp.status_code} from {url}")
+    else:
+        xmplaylist_breaker.record_success()
+
+async def _hedged_get(url, params):
+    # HEDGE_DELAY is measured from when the request is sent, and the duplicate is just another task on the
+    # same loop, so concurrent callers never wait on each other. The first good answer wins; the other is cancelled.
+    attempts = [asyncio.ensure_future(_get(url, params))]
+    done, pending = await asyncio.wait(attempts, timeout=HEDGE_DELAY)
+    if pending:
+        print(f"Hedging slow request: {url}")
+        attempts.append(asyncio.ensure_future(_get(url, params)))
+
+    # Take the first good answer; only fail if every attempt failed
+    error = None
+    bad_resp = None
+    pending = set(attempts)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for attempt in done:
+                if attempt.exception() is not None:
+                    error = attempt.exception()
+                elif _is_upstream_failure(attempt.result().status_code):
+                    bad_resp = attempt.result()
+                else:
+                    return attempt.result()
+    finally:
+        for attempt in pending:
+            attempt.cancel()
+    if bad_resp is not None:
+        return bad_resp
+    raise error
+
+STATION_LIST_URL = f"{XMPLAYLIST_BASE_URL}/station"
 
 def get_stations():
+    return asyncio.run(get_stations_async())
+
+async def get_stations_async():
     # Scrape the station list from xmplaylist.com/station
-    url = "https://xmplaylist.com/station"
+    url = STATION_LIST_URL
     try:
         print(f"Fetching stations from {url}...")
-        response = requests.get(url, impersonate="chrome")
+        response = await upstream_get_async(url)
         print(f"Station Fetch Status: {response.status_code}")
         response.raise_for_status()
     except Exception as e:
         print(f"Error fetching stations: {e}")
         return []
 
-    soup = BeautifulSoup(response.text, 'html.parser')
+    return parse_stations(response.text)
+
+def parse_stations(html):
+    soup = BeautifulSoup(html, 'html.parser')
     stations = []
     
     # Filter valid station links
@@ -49,7 +171,7 @@ def get_stations():
             stations.append({
                 'raw_name': raw_name,
                 'channel_num': number_text,
-                'url': f"https://xmplaylist.com{href}",
+                'url': f"{XMPLAYLIST_BASE_URL}{href}",
                 'id': station_id
             })
             
@@ -89,66 +211,116 @@ def get_stations():
 
     return filtered_stations
 
-def fetch_from_api(station_id, mode, days=None, limit=60):
-    base_api = f"https://xmplaylist.com/api/station/{station_id}"
-    
+def api_endpoint(station_id, mode, days=None):
+    # Returns (url, params, paged) for the xmplaylist API call behind a scrape mode
+    base_api = f"{XMPLAYLIST_BASE_URL}/api/station/{station_id}"
+
     if mode == 'newest':
-        url = f"{base_api}/newest"
-        return fetch_all_results(url, limit)
+        return f"{base_api}/newest", None, False
     elif mode == 'most_heard':
-        url = f"{base_api}/most-heard"
         params = {}
         if days:
             params['days'] = days
-        return fetch_all_results(url, limit, params)
+        return f"{base_api}/most-heard", params, False
+    else:
+        return base_api, None, True
+
+async def fetch_from_api(station_id, mode, days=None, limit=60):
+    url, params, paged = api_endpoint(station_id, mode, days)
+    coverage = new_coverage()
+    if paged:
+        tracks = await fetch_paged_results(url, limit, coverage)
     else:
-        return fetch_paged_results(base_api, limit)
+        tracks = await fetch_all_results(url, limit, params, coverage)
+    _note_coverage(station_id, mode, coverage)
+    return tracks
+
+def new_coverage():
+    # Filled in by process_api_results: plays the API returned vs. plays that had a Spotify id
+    return {'seen': 0, 'with_spotify': 0}
+
+def _note_coverage(station_id, mode, coverage):
+    if coverage['seen']:
+        _last_coverage[(station_id, mode)] = coverage
 
-def fetch_all_results(url, limit, params=None):
+def coverage_for(station_id, mode):
+    # {'seen', 'with_spotify'} from the last live scrape of the feed in this process, or None
+    return _last_coverage.get((station_id, mode))
+
+async def api_get_json(url, params=None):
+    # upstream_get_json for the scrape paths: a failure of xmplaylist itself raises UpstreamError
+    # instead of reading as an empty feed. Other statuses (e.g. 404 for an unknown station) are returned.
+    try:
+        status, data = await upstream_get_json_async(url, params=params, hedge=True)
+    except CircuitOpenError:
+        raise
+    except Exception as e:
+        raise UpstreamError(f"XM Playlist request failed: {e}") from e
+    if status in (403, 429):
+        raise UpstreamError(f"XM Playlist blocked the request (HTTP {status})")
+    if _is_upstream_failure(status):
+        raise UpstreamError(f"XM Playlist returned HTTP {status}")
+    return status, data
+
+async def fetch_all_results(url, limit, params=None, coverage=None):
     print(f"API Fetch: {url} params={params}")
+    status, data = await api_get_json(url, params)
+    if status != 200:
+        print(f"API Error {status}")
+        return []
+
     try:
-        resp = requests.get(url, params=params, impersonate="chrome")
-        if resp.status_code != 200:
-            print(f"API Error {resp.status_code}")
-            return []
-        
-        data = resp.json()
-        results = data.get('results', [])
-        if not results and isinstance(data, list):
-            results = data
-            
-        return process_api_results(results[:limit])
+        return process_api_results(extract_results(data)[:limit], coverage)
     except Exception as e:
         print(f"API Exception: {e}")
         return []
 
-def fetch_paged_results(url, target_count):
-    all_tracks = []
+async def fetch_paged_results(url, target_count, coverage=None):
+    return [track async for page in iter_paged_results(url, target_count, coverage) for track in page]
+
+async def iter_paged_results(url, target_count, coverage=None):
+    # Yields each page's tracks as soon as it arrives, so callers can start exporting before the last page
+    count = 0
     next_url = url
     
-    while next_url and len(all_tracks) < target_count:
+    while next_url and count < target_count:
         print(f"Fetching Page: {next_url}")
         try:
-            resp = requests.get(next_url, impersonate="chrome")
-            if resp.status_code != 200:
+            status, data = await api_get_json(next_url)
+            if status != 200:
+                print(f"API Error {status}")
                 break
             
-            data = resp.json()
-            results = data.get('results', [])
-            all_tracks.extend(process_api_results(results))
-            
-            next_url = data.get('next')
-            # Fix next url if it's http
-            if next_url and next_url.startswith('http:'):
-                next_url = next_url.replace('http:', 'https:')
+            tracks = process_api_results(extract_results(data), coverage)[:target_count - count]
+            next_url = next_page_url(data)
                 
+        except (CircuitOpenError, UpstreamError) as e:
+            if count:
+                # Keep what we already have rather than failing the whole station
+                print(f"Pagination stopped: {e}")
+                break
+            raise
         except Exception as e:
             print(f"Pagination Error: {e}")
             break
-            
-    return all_tracks[:target_count]
 
-def process_api_results(results):
+        count += len(tracks)
+        yield tracks
+
+def extract_results(data):
+    results = data.get('results', []) if isinstance(data, dict) else []
+    if not results and isinstance(data, list):
+        results = data
+    return results
+
+def next_page_url(data):
+    next_url = data.get('next') if isinstance(data, dict) else None
+    # Fix next url if it's http (unless we're deliberately talking plain http to a local stand-in)
+    if next_url and next_url.startswith('http:') and XMPLAYLIST_BASE_URL.startswith('https:'):
+        next_url = next_url.replace('http:', 'https:')
+    return next_url
+
+def process_api_results(results, coverage=None):
     tracks = []
     for item in results:
         try:
@@ -177,12 +349,26 @@ def process_api_results(results):
             })
         except Exception as e:
             continue
+    if coverage is not None:
+        coverage['seen'] += len(results)
+        coverage['with_spotify'] += len(tracks)
     return tracks
 
-def scrape_tracks(url, limit=60):
-    print(f"Scraping {url} with limit {limit}...")
-    
-    # Parse URL to determine mode and station
+def build_scrape_url(station, mode='recent', days=None):
+    # Accepts a bare station id or a full station URL and returns the page URL for the mode
+    if station.startswith('http'):
+        base_url = station.rstrip('/')
+    else:
+        base_url = f"{XMPLAYLIST_BASE_URL}/station/{station}"
+
+    if mode == 'newest':
+        return f"{base_url}/newest"
+    elif mode == 'most_heard':
+        return f"{base_url}/most-heard?days={days}" if days else f"{base_url}/most-heard"
+    return base_url
+
+def parse_scrape_url(url):
+    # Returns (station_id, mode, days) for a station page URL, or None if it isn't one
     parsed = urlparse(url)
     path_parts = parsed.path.strip('/').split('/')    
     if len(path_parts) >= 2 and path_parts[0] == 'station':
@@ -197,9 +383,41 @@ def scrape_tracks(url, limit=60):
                 mode = 'most_heard'
                 qs = parse_qs(parsed.query)
                 days = qs.get('days', [None])[0]
-        
+        return station_id, mode, days
+    return None
+
+def scrape_tracks(url, limit=60):
+    return asyncio.run(scrape_tracks_async(url, limit))
+
+async def scrape_tracks_async(url, limit=60):
+    print(f"Scraping {url} with limit {limit}...")
+    
+    # Parse URL to determine mode and station
+    target = parse_scrape_url(url)
+    if target:
+        station_id, mode, days = target
         print(f"Detected Station: {station_id}, Mode: {mode}, Days: {days}")
-        return fetch_from_api(station_id, mode, days, limit)
+        return await fetch_from_api(station_id, mode, days, limit)
 
     print("URL pattern not recognized. Returning empty.")
     return []
+
+def iter_track_pages(url, limit=60):
+    return _iterate(iter_track_pages_async(url, limit))
+
+async def iter_track_pages_async(url, limit=60):
+    # Streaming variant of scrape_tracks: yields lists of tracks page by page
+    target = parse_scrape_url(url)
+    if not target:
+        print("URL pattern not recognized. Returning empty.")
+        return
+
+    station_id, mode, days = target
+    api_url, params, paged = api_endpoint(station_id, mode, days)
+    coverage = new_coverage()
+    if paged:
+        async for tracks in iter_paged_results(api_url, limit, coverage):
+            yield tracks
+    else:
+        yield await fetch_all_results(api_url, limit, params, coverage)
+    _note_coverage(station_id, mode, coverage)
@@ -0,0 +1,263 @@
+import json
+import time
+import asyncio
+import datetime
+import spotipy
+from spotipy.oauth2 import SpotifyOauthError
+from curl_cffi.requests import AsyncSession
+
+import fingerprints
+from spotify_client import (build_playlist_name, write_tracks_parallel, spotify_for_token, BATCH_SIZE,
+                            PARALLEL_WRITE_MIN_TRACKS, SPOTIFY_API_PREFIX, SPOTIFY_POOL_MAXSIZE)
+
+# Awaitable Spotify calls for the async views. Method names and arguments follow spotipy.Spotify, and
+# errors are raised as spotipy's SpotifyException, so the callers read like their spotify_client.py twins.
+# The CLI, bench.py and the subscription cycle keep using spotipy through spotify_client.py.
+
+REQUEST_TIMEOUT = 5  # spotipy's default
+# Same statuses and attempts as the retry policy on spotify_client's pooled session
+RETRY_STATUSES = spotipy.Spotify.default_retry_codes
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 0.3
+
+class AsyncSpotify:
+    # One per request: the session, and any cookie Spotify sets on it, never serves another user.
+    #   async with AsyncSpotify(token_info['access_token']) as sp:
+    #       await create_playlist_and_add_tracks(sp, track_ids, ...)
+
+    def __init__(self, access_token):
+        self.access_token = access_token
+        self.prefix = SPOTIFY_API_PREFIX or "https://api.spotify.com/v1/"
+        self._session = AsyncSession(max_clients=SPOTIFY_POOL_MAXSIZE)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._session.close()
+
+    async def _call(self, method, path, payload=None, params=None):
+        url = path if path.startswith('http') else self.prefix + path
+        headers = {'Authorization': f"Bearer {self.access_token}", 'Content-Type': 'application/json'}
+        data = json.dumps(payload) if payload is not None else None
+        for attempt in range(MAX_RETRIES + 1):
+            resp = await self._session.request(method, url, params=params, data=data, headers=headers, timeout=REQUEST_TIMEOUT)
+            # A POST that failed with a 5xx may still have been applied, and adding the same items twice
+            # would duplicate them; 429 means it was never processed
+            retry = resp.status_code in RETRY_STATUSES and (method != 'POST' or resp.status_code == 429)
+            if not retry or attempt == MAX_RETRIES:
+                break
+            await asyncio.sleep(_retry_delay(resp, attempt))
+
+        if resp.status_code >= 400:
+            try:
+                error = resp.json().get('error', {})
+                msg, reason = error.get('message'), error.get('reason')
+            except (ValueError, AttributeError):
+                msg, reason = resp.text or None, None
+            raise spotipy.SpotifyException(resp.status_code, -1, f"{resp.url}:\n {msg}", reason=reason,
+                                           headers=dict(resp.headers))
+        try:
+            return resp.json()
+        except ValueError:
+            return None
+
+    async def current_user(self):
+        return await self._call('GET', 'me')
+
+    async def current_user_playlists(self, limit=50, offset=0):
+        return await self._call('GET', 'me/playlists', params={'limit': limit, 'offset': offset})
+
+    async def user_playlist_create(self, user, name, public=True, description=""):
+        return await self._call('POST', f"users/{user}/playlists",
+                                {'name': name, 'public': public, 'description': description})
+
+    async def playlist_change_details(self, playlist_id, description=None):
+        return await self._call('PUT', f"playlists/{playlist_id}", {'description': description})
+
+    async def playlist_replace_items(self, playlist_id, items):
+        return await self._call('PUT', f"playlists/{playlist_id}/items", {'uris': list(items)})
+
+    async def playlist_add_items(self, playlist_id, items, position=None):
+        params = {'position': position} if position is not None else None
+        return await self._call('POST', f"playlists/{playlist_id}/items", list(items), params)
+
+def _retry_delay(resp, attempt):
+    retry_after = resp.headers.get('Retry-After')
+    if retry_after and retry_after.isdigit():
+        return int(retry_after)
+    return BACKOFF_FACTOR * 2 ** attempt
+
+async def refresh_access_token(sp_oauth, refresh_token):
+    # sp_oauth.refresh_access_token() without blocking the loop: same request, token_info and errors
+    async with AsyncSession() as session:
+        resp = await session.post(sp_oauth.OAUTH_TOKEN_URL, headers=sp_oauth._make_authorization_headers(),
+                                  data={'refresh_token': refresh_token, 'grant_type': 'refresh_token'},
+                                  timeout=REQUEST_TIMEOUT)
+    try:
+        token_info = resp.json()
+    except ValueError:
+        token_info = None
+    if resp.status_code >= 400 or not isinstance(token_info, dict):
+        error = token_info.get('error') if isinstance(token_info, dict) else resp.text or None
+        description = token_info.get('error_description') if isinstance(token_info, dict) else None
+        raise SpotifyOauthError(f"error: {error}, error_description: {description}",
+                                error=error, error_description=description)
+
+    token_info['expires_at'] = int(time.time()) + token_info['expires_in']
+    token_info['scope'] = sp_oauth.scope
+    token_info.setdefault('refresh_token', refresh_token)
+    return token_info
+
+async def write_tracks_serial(sp, playlist_id, track_uris):
+    # First batch uses replace to clear old tracks if updating
+    await sp.playlist_replace_items(playlist_id, track_uris[:BATCH_SIZE])
+    print(f"Batch 1 processed")
+
+    for i in range(BATCH_SIZE, len(track_uris), BATCH_SIZE):
+        await sp.playlist_add_items(playlist_id, track_uris[i:i + BATCH_SIZE])
+        print(f"Batch {i//BATCH_SIZE + 1} added")
+
+async def find_playlist(sp, playlist_name):
+    # Returns (user_id, playlist_id, playlist_url); the playlist parts are None if it doesn't exist yet
+    user_id = (await sp.current_user())['id']
+
+    print(f"Searching for existing playlist '{playlist_name}'...")
+    try:
+        results = await sp.current_user_playlists(limit=50)
+        for item in results['items']:
+            if item['name'] == playlist_name:
+                return user_id, item['id'], item['external_urls']['spotify']
+    except Exception as e:
+        print(f"Warning: Could not search playlists: {e}")
+    return user_id, None, None
+
+async def prepare_playlist(sp, playlist_name, found):
+    # Stamps an existing playlist or creates a new one; returns (playlist_id, playlist_url)
+    user_id, playlist_id, playlist_url = found
+    date_str = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    description = f"Last updated: {date_str}"
+
+    if playlist_id:
+        print(f"Found existing playlist. Updating tracks and description...")
+        await sp.playlist_change_details(playlist_id, description=description)
+        return playlist_id, playlist_url
+
+    print(f"Creating new playlist '{playlist_name}'...")
+    playlist = await sp.user_playlist_create(user=user_id, name=playlist_name, public=True, description=description)
+    return playlist['id'], playlist['external_urls']['spotify']
+
+async def create_playlist_and_add_tracks(sp, track_ids, station_id="unknown", scrape_type="recent", days=None, station_name=None, custom_name=None, user_key=None, parallel=None, skip_unchanged=True):
+    # Async twin of spotify_client.create_playlist_and_add_tracks, with the same arguments and fingerprinting.
+    # An opted-in parallel write keeps its thread pool and ordering pass, so it runs off the loop through spotipy.
+    if not track_ids:
+        return None
+
+    playlist_name = build_playlist_name(station_id, scrape_type, days, station_name, custom_name)
+
+    if user_key and skip_unchanged:
+        unchanged_url = fingerprints.unchanged_playlist_url(user_key, playlist_name, track_ids)
+        if unchanged_url:
+            print(f"Playlist '{playlist_name}' is unchanged since the last export. Skipping.")
+            return unchanged_url
+
+    playlist_id, playlist_url = await prepare_playlist(sp, playlist_name, await find_playlist(sp, playlist_name))
+
+    track_uris = [f"spotify:track:{tid}" for tid in track_ids]
+    if parallel is None:
+        parallel = bool(PARALLEL_WRITE_MIN_TRACKS) and len(track_uris) >= PARALLEL_WRITE_MIN_TRACKS
+
+    print(f"Syncing {len(track_uris)} tracks to playlist...")
+    if parallel:
+        await asyncio.to_thread(write_tracks_parallel, spotify_for_token(sp.access_token), playlist_id, track_uris)
+    else:
+        await write_tracks_serial(sp, playlist_id, track_uris)
+
+    if user_key:
+        fingerprints.record_export(user_key, playlist_name, track_ids, playlist_url)
+
+    print(f"Done! Playlist URL: {playlist_url}")
+    return playlist_url
+
+def _settle(task):
+    # Cancels a task we no longer need, or marks its exception as seen so asyncio doesn't log it
+    if not task.done():
+        task.cancel()
+    elif not task.cancelled():
+        task.exception()
+
+class PlaylistStream:
+    # Async twin of spotify_client.PlaylistStream. Each full 100-track batch becomes a task that waits for
+    # the one before it, so batches land in order and add() never waits on Spotify.
+
+    def __init__(self, sp, station_id="unknown", scrape_type="recent", days=None, station_name=None, custom_name=None, user_key=None):
+        self.sp = sp
+        self.user_key = user_key
+        self.playlist_name = build_playlist_name(station_id, scrape_type, days, station_name, custom_name)
+        self.track_ids = []
+        self.playlist_url = None
+        self._playlist_id = None
+        self._pending = []
+        self._batches_written = 0
+        self._error = None
+        self._found = asyncio.ensure_future(find_playlist(sp, self.playlist_name))
+        self._last_write = None
+
+    def add(self, track_ids):
+        self.track_ids.extend(track_ids)
+        self._pending.extend(track_ids)
+        while len(self._pending) >= BATCH_SIZE:
+            batch, self._pending = self._pending[:BATCH_SIZE], self._pending[BATCH_SIZE:]
+            self._queue(batch)
+
+    def _queue(self, track_ids):
+        self._last_write = asyncio.ensure_future(self._write_batch(track_ids, self._last_write))
+
+    async def _write_batch(self, track_ids, previous):
+        if previous:
+            await previous
+        if self._error:
+            return
+        try:
+            if self._playlist_id is None:
+                self._playlist_id, self.playlist_url = await prepare_playlist(self.sp, self.playlist_name, await self._found)
+            uris = [f"spotify:track:{tid}" for tid in track_ids]
+            if self._batches_written == 0:
+                # First batch uses replace to clear old tracks if updating
+                await self.sp.playlist_replace_items(self._playlist_id, uris)
+            else:
+                await self.sp.playlist_add_items(self._playlist_id, uris)
+            self._batches_written += 1
+            print(f"Batch {self._batches_written} streamed to '{self.playlist_name}'")
+        except Exception as e:
+            self._error = e
+
+    async def finish(self):
+        # Writes the partial last batch, waits for the writes and returns the playlist URL (None if no tracks)
+        try:
+            if self._pending:
+                self._queue(self._pending)
+                self._pending = []
+            if self._last_write:
+                await self._last_write
+        finally:
+            _settle(self._found)
+
+        if self._error:
+            raise self._error
+        if not self.track_ids:
+            return None
+
+        if self.user_key:
+            fingerprints.record_export(self.user_key, self.playlist_name, self.track_ids, self.playlist_url)
+        print(f"Done! Playlist URL: {self.playlist_url}")
+        return self.playlist_url
+
+    async def abort(self):
+        # The scrape failed: stop writing. Batches already sent stay in the playlist.
+        self._error = self._error or RuntimeError("Export aborted")
+        try:
+            if self._last_write:
+                await self._last_write
+        finally:
+            _settle(self._found)
@@ -1,87 +1,375 @@
+import os
 import re
+import bisect
 import datetime
+import threading
+from http.cookiejar import DefaultCookiePolicy
+from concurrent.futures import ThreadPoolExecutor
+import requests
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth
+from urllib3.util.retry import Retry
 
 from spotipy.cache_handler import MemoryCacheHandler
+import fingerprints
+
+# Max concurrent keep-alive connections per Spotify host (api. and accounts.) shared by every client in the process
+SPOTIFY_POOL_MAXSIZE = int(os.environ.get("SPOTIFY_POOL_MAXSIZE", "32"))
+
+class _PooledSession(requests.Session):
+    # spotipy closes its session when a client is garbage collected; the shared pool has to outlive every client
+    def close(self):
+        pass
+
+def _build_pooled_session():
+    session = _PooledSession()
+    # The session is shared by every user's client, so a cookie set for one user would be sent for the next; keep none
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    # Same retry policy spotipy sets up for its own per-client sessions
+    retry = Retry(
+        total=3,
+        connect=None,
+        read=False,
+        allowed_methods=frozenset(['GET', 'POST', 'PUT', 'DELETE']),
+        status=3,
+        backoff_factor=0.3,
+        status_forcelist=spotipy.Spotify.default_retry_codes)
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=SPOTIFY_POOL_MAXSIZE, max_retries=retry)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+# Opt-in: playlists at least this long are written with concurrent batches plus an ordering pass.
+# That costs 2-4x the API calls of a serial write (moves and read-backs), so 0 (the default) keeps every write serial.
+PARALLEL_WRITE_MIN_TRACKS = int(os.environ.get("SPOTIFY_PARALLEL_WRITE_MIN_TRACKS", "0"))
+# In-flight writes per playlist; Spotify's rate limit is per app over a rolling window, so keep this small
+SPOTIFY_WRITE_CONCURRENCY = int(os.environ.get("SPOTIFY_WRITE_CONCURRENCY", "4"))
+SPOTIFY_READ_CONCURRENCY = int(os.environ.get("SPOTIFY_READ_CONCURRENCY", "10"))
+BATCH_SIZE = 100  # Spotify API limit for adding tracks
+
+# Alternate Web API base (e.g. http://127.0.0.1:8001/v1/ for the stub in stub_servers.py); unset means Spotify
+SPOTIFY_API_PREFIX = os.environ.get("SPOTIFY_API_PREFIX")
+
+# Process-wide transport: TLS connections to api.spotify.com are reused across requests and users.
+# Authorization is not stored on the session; spotipy sends each client's own bearer token per call.
+spotify_session = _build_pooled_session()
+
+def _with_prefix(sp):
+    if SPOTIFY_API_PREFIX:
+        sp.prefix = SPOTIFY_API_PREFIX
+    return sp
+
+def spotify_for_token(access_token):
+    return _with_prefix(spotipy.Spotify(auth=access_token, requests_session=spotify_session))
 
 def get_spotify_client(client_id, client_secret):
-    return spotipy.Spotify(auth_manager=SpotifyOAuth(
+    return _with_prefix(spotipy.Spotify(auth_manager=SpotifyOAuth(
         client_id=client_id,
         client_secret=client_secret,
         redirect_uri="http://localhost:8888/callback",
         scope="playlist-modify-public playlist-modify-private",
-        cache_handler=MemoryCacheHandler()
-    ))
+        cache_handler=MemoryCacheHandler(),
+        requests_session=spotify_session
+    ), requests_session=spotify_session))
 
-def create_playlist_and_add_tracks(sp, track_ids, station_id="unknown", scrape_type="recent", days=None, station_name=None, custom_name=None):
-    # Creates or updates a playlist for the given station
-    if not track_ids:
-        return None
-        
-    user_id = sp.current_user()['id']
-    
+def get_spotify_client_from_refresh_token(client_id, client_secret, refresh_token):
+    # Non-interactive client for headless runs; spotipy refreshes the access token as it expires
+    scope = "playlist-modify-public playlist-modify-private"
+    token_info = {
+        'access_token': None,
+        'refresh_token': refresh_token,
+        'expires_at': 0,
+        'scope': scope,
+        'token_type': 'Bearer'
+    }
+    return _with_prefix(spotipy.Spotify(auth_manager=SpotifyOAuth(
+        client_id=client_id,
+        client_secret=client_secret,
+        redirect_uri="http://localhost:8888/callback",
+        scope=scope,
+        cache_handler=MemoryCacheHandler(token_info=token_info),
+        requests_session=spotify_session
+    ), requests_session=spotify_session))
+
+def build_playlist_name(station_id="unknown", scrape_type="recent", days=None, station_name=None, custom_name=None):
     if custom_name:
-        playlist_name = custom_name
+        return custom_name
+
+    # Construct descriptive name
+    if station_name:
+        # Remove leading numbers (e.g. "34 - Lithium" -> "Lithium")
+        name_suffix = re.sub(r'^\d+\s+-\s+', '', station_name)
     else:
-        # Construct descriptive name
-        if station_name:
-            # Remove leading numbers (e.g. "34 - Lithium" -> "Lithium")
-            name_suffix = re.sub(r'^\d+\s+-\s+', '', station_name)
-        else:
-            name_suffix = station_id.replace('-', ' ').title() if station_id != "unknown" else "Unknown Station"
-        
-        if scrape_type == 'newest':
-            playlist_name = f"XM: {name_suffix} - Newest Additions"
-        elif scrape_type == 'most_heard':
-            timeframe = f" ({days} Days)" if days else ""
-            playlist_name = f"XM: {name_suffix} - Most Played {timeframe}"
-        else:
-             playlist_name = f"XM: {name_suffix} - Recently Played"
-    
-    date_str = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    description = f"Last updated: {date_str}"
+        name_suffix = station_id.replace('-', ' ').title() if station_id != "unknown" else "Unknown Station"
+
+    if scrape_type == 'newest':
+        return f"XM: {name_suffix} - Newest Additions"
+    elif scrape_type == 'most_heard':
+        timeframe = f" ({days} Days)" if days else ""
+        return f"XM: {name_suffix} - Most Played {timeframe}"
+    else:
+        return f"XM: {name_suffix} - Recently Played"
+
+def build_merged_playlist_name(station_names, scrape_type="recent", days=None, custom_name=None):
+    # Pass every requested station, not just the ones that scraped, so a mix always lands in the same playlist.
+    # The "XM Mix:" prefix keeps it apart from the single-station playlists, even for a one-station mix.
+    if custom_name:
+        return custom_name
+    names = [re.sub(r'^\d+\s+-\s+', '', name) for name in station_names]
+    label = ' + '.join(names[:3]) + (f" + {len(names) - 3} more" if len(names) > 3 else "")
+    return build_playlist_name(scrape_type=scrape_type, days=days, station_name=label).replace("XM: ", "XM Mix: ", 1)
+
+def write_tracks_serial(sp, playlist_id, track_uris):
+    # First batch uses replace to clear old tracks if updating
+    first_batch = track_uris[:BATCH_SIZE]
+    sp.playlist_replace_items(playlist_id, first_batch)
+    print(f"Batch 1 processed")
     
-    # Search for existing playlist
-    playlist_id = None
-    playlist_url = None
+
+    for i in range(BATCH_SIZE, len(track_uris), BATCH_SIZE):
+        batch = track_uris[i:i + BATCH_SIZE]
+        sp.playlist_add_items(playlist_id, batch)
+        print(f"Batch {i//BATCH_SIZE + 1} added")
+
+def read_playlist_uris(sp, playlist_id, count):
+    # Returns (first count uris, playlist total). Pages are independent reads, so fetch them all at once;
+    # the total shows anything past count, e.g. a batch a retried POST appended twice.
+    def read_page(offset):
+        page = sp.playlist_items(playlist_id, fields='items(track(uri)),total', limit=BATCH_SIZE, offset=offset, additional_types=('track',))
+        return [item['track']['uri'] for item in page['items'] if item.get('track')], page['total']
+
+    with ThreadPoolExecutor(max_workers=SPOTIFY_READ_CONCURRENCY) as pool:
+        pages = list(pool.map(read_page, range(0, count, BATCH_SIZE)))
+        return [uri for uris, _ in pages for uri in uris], max(total for _, total in pages)
+
+def _longest_ordered_run(order):
+    # Batch indices forming a longest increasing subsequence of order; those blocks can stay where they are
+    tails, tail_slots, previous = [], [], [None] * len(order)
+    for slot, index in enumerate(order):
+        k = bisect.bisect_left(tails, index)
+        if k == len(tails):
+            tails.append(index)
+            tail_slots.append(slot)
+        else:
+            tails[k] = index
+            tail_slots[k] = slot
+        previous[slot] = tail_slots[k - 1] if k else None
+
+    keep = set()
+    slot = tail_slots[-1] if tail_slots else None
+    while slot is not None:
+        keep.add(order[slot])
+        slot = previous[slot]
+    return keep
+
+def _move_blocks_into_order(sp, playlist_id, order):
+    # order[slot] is the index of the 100-track batch currently in that slot (slot 0 starts after the first batch).
+    # Every move is a sequential round trip, so only blocks outside the longest already-ordered run are moved,
+    # each one to just after its predecessor.
+    order = list(order)
+    keep = _longest_ordered_run(order)
+    moves = 0
+    for index in sorted(set(order) - keep):
+        source = order.index(index)
+        order.pop(source)
+        target = order.index(index - 1) + 1 if index else 0
+        # insert_before is counted before the block is taken out
+        insert_before = target if target <= source else target + 1
+        sp.playlist_reorder_items(playlist_id, range_start=BATCH_SIZE * (source + 1),
+                                  insert_before=BATCH_SIZE * (insert_before + 1), range_length=BATCH_SIZE)
+        order.insert(target, index)
+        moves += 1
+    return moves
+
+def _slot_order_from_contents(current, batches):
+    slots_by_content = {}
+    for index, batch in enumerate(batches):
+        slots_by_content.setdefault(tuple(batch), []).append(index)
+    order = []
+    for slot in range(len(batches)):
+        offset = BATCH_SIZE * (slot + 1)
+        candidates = slots_by_content.get(tuple(current[offset:offset + BATCH_SIZE]))
+        if not candidates:
+            return None
+        order.append(candidates.pop(0))
+    return order
+
+def write_tracks_parallel(sp, playlist_id, track_uris):
+    # Concurrent appends land in whatever order Spotify processes them. We assume that matches the order
+    # the responses came back in, move misplaced 100-track blocks into position, then read the playlist
+    # back to verify. If the guess was wrong the read-back tells us where every block really is.
+    # The first batch (replace) and the short tail batch are written serially so every concurrently
+    # written block is exactly 100 tracks.
+    batches = [track_uris[i:i + BATCH_SIZE] for i in range(0, len(track_uris), BATCH_SIZE)]
+    if len(batches) < 3:
+        return write_tracks_serial(sp, playlist_id, track_uris)
+
+    head, middle = batches[0], batches[1:]
+    tail = middle.pop() if len(middle[-1]) < BATCH_SIZE else None
+
+    sp.playlist_replace_items(playlist_id, head)
+    print(f"Batch 1 processed, adding {len(middle)} batches with {SPOTIFY_WRITE_CONCURRENCY} workers")
+
+    completed = []
+    lock = threading.Lock()
+
+    def add(index):
+        sp.playlist_add_items(playlist_id, middle[index])
+        with lock:
+            completed.append(index)
+
+    with ThreadPoolExecutor(max_workers=SPOTIFY_WRITE_CONCURRENCY) as pool:
+        list(pool.map(add, range(len(middle))))
+    if tail:
+        sp.playlist_add_items(playlist_id, tail)
+
+    moves = _move_blocks_into_order(sp, playlist_id, completed)
+    current, total = read_playlist_uris(sp, playlist_id, len(track_uris))
+    if current != track_uris and total == len(track_uris):
+        order = _slot_order_from_contents(current, middle)
+        if order is not None:
+            print("Completion order did not match the playlist; reordering from its actual contents")
+            moves += _move_blocks_into_order(sp, playlist_id, order)
+            current, total = read_playlist_uris(sp, playlist_id, len(track_uris))
+    print(f"Ordering pass moved {moves} of {len(middle)} batches")
+
+    if current != track_uris or total != len(track_uris):
+        # Someone else edited the playlist mid-write, or a batch was lost or added twice; fall back to the safe path
+        print("Warning: playlist contents did not verify after parallel write. Rewriting serially...")
+        write_tracks_serial(sp, playlist_id, track_uris)
+
+def find_playlist(sp, playlist_name):
+    # Returns (user_id, playlist_id, playlist_url); the playlist parts are None if it doesn't exist yet
+    user_id = sp.current_user()['id']
     
     print(f"Searching for existing playlist '{playlist_name}'...")
     try:
         results = sp.current_user_playlists(limit=50)
         for item in results['items']:
             if item['name'] == playlist_name:
-                playlist_id = item['id']
-                playlist_url = item['external_urls']['spotify']
-                break
+                return user_id, item['id'], item['external_urls']['spotify']
     except Exception as e:
         print(f"Warning: Could not search playlists: {e}")
+    return user_id, None, None
+
+def prepare_playlist(sp, playlist_name, found):
+    # Stamps an existing playlist or creates a new one; returns (playlist_id, playlist_url)
+    user_id, playlist_id, playlist_url = found
+    date_str = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    description = f"Last updated: {date_str}"
 
     if playlist_id:
         print(f"Found existing playlist. Updating tracks and description...")
         sp.playlist_change_details(playlist_id, description=description)
-    else:
-        print(f"Creating new playlist '{playlist_name}'...")
-        playlist = sp.user_playlist_create(user=user_id, name=playlist_name, public=True, description=description)
-        playlist_id = playlist['id']
-        playlist_url = playlist['external_urls']['spotify']
+        return playlist_id, playlist_url
+
+    print(f"Creating new playlist '{playlist_name}'...")
+    playlist = sp.user_playlist_create(user=user_id, name=playlist_name, public=True, description=description)
+    return playlist['id'], playlist['external_urls']['spotify']
+
+def create_playlist_and_add_tracks(sp, track_ids, station_id="unknown", scrape_type="recent", days=None, station_name=None, custom_name=None, user_key=None, parallel=None, skip_unchanged=True):
+    # Creates or updates a playlist for the given station.
+    # With a user_key, an export identical to the last one for that user/playlist is skipped without touching Spotify
+    # (skip_unchanged=False writes anyway and still records the fingerprint).
+    # parallel=None writes serially unless SPOTIFY_PARALLEL_WRITE_MIN_TRACKS opts long playlists into concurrent batches.
+    if not track_ids:
+        return None
+
+    playlist_name = build_playlist_name(station_id, scrape_type, days, station_name, custom_name)
+
+    if user_key and skip_unchanged:
+        unchanged_url = fingerprints.unchanged_playlist_url(user_key, playlist_name, track_ids)
+        if unchanged_url:
+            print(f"Playlist '{playlist_name}' is unchanged since the last export. Skipping.")
+            return unchanged_url
+
+    playlist_id, playlist_url = prepare_playlist(sp, playlist_name, find_playlist(sp, playlist_name))
     
-    # Spotify API limit for adding tracks is 100
     track_uris = [f"spotify:track:{tid}" for tid in track_ids]
-    batch_size = 100
+    if parallel is None:
+        parallel = bool(PARALLEL_WRITE_MIN_TRACKS) and len(track_uris) >= PARALLEL_WRITE_MIN_TRACKS
     
     print(f"Syncing {len(track_uris)} tracks to playlist...")
-    
-    # First batch uses replace to clear old tracks if updating
-    first_batch = track_uris[:batch_size]
-    sp.playlist_replace_items(playlist_id, first_batch)
-    print(f"Batch 1 processed")
-    
-
-    for i in range(batch_size, len(track_uris), batch_size):
-        batch = track_uris[i:i + batch_size]
-        sp.playlist_add_items(playlist_id, batch)
-        print(f"Batch {i//batch_size + 1} added")
+    if parallel:
+        write_tracks_parallel(sp, playlist_id, track_uris)
+    else:
+        write_tracks_serial(sp, playlist_id, track_uris)
         
+    if user_key:
+        fingerprints.record_export(user_key, playlist_name, track_ids, playlist_url)
+
     print(f"Done! Playlist URL: {playlist_url}")
     return playlist_url
+
+class PlaylistStream:
+    # Streaming export: writes a playlist while its tracks are still being scraped.
+    # The playlist lookup starts as soon as the stream is created, and every full 100-track batch is
+    # written as soon as add() completes it. One writer thread keeps the calls in order, so the
+    # caller never blocks on Spotify until finish().
+    # The playlist is only created or stamped once there is a first batch, so an empty scrape leaves
+    # Spotify untouched. Unlike create_playlist_and_add_tracks, an unchanged export cannot be skipped
+    # because writing starts before the full track list is known; the fingerprint is still recorded.
+
+    def __init__(self, sp, station_id="unknown", scrape_type="recent", days=None, station_name=None, custom_name=None, user_key=None):
+        self.sp = sp
+        self.user_key = user_key
+        self.playlist_name = build_playlist_name(station_id, scrape_type, days, station_name, custom_name)
+        self.track_ids = []
+        self.playlist_url = None
+        self._playlist_id = None
+        self._pending = []
+        self._batches_written = 0
+        self._error = None
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="playlist-stream")
+        self._found = self._writer.submit(find_playlist, sp, self.playlist_name)
+        self._writes = []
+
+    def add(self, track_ids):
+        self.track_ids.extend(track_ids)
+        self._pending.extend(track_ids)
+        while len(self._pending) >= BATCH_SIZE:
+            batch, self._pending = self._pending[:BATCH_SIZE], self._pending[BATCH_SIZE:]
+            self._writes.append(self._writer.submit(self._write_batch, batch))
+
+    def _write_batch(self, track_ids):
+        if self._error:
+            return
+        try:
+            if self._playlist_id is None:
+                self._playlist_id, self.playlist_url = prepare_playlist(self.sp, self.playlist_name, self._found.result())
+            uris = [f"spotify:track:{tid}" for tid in track_ids]
+            if self._batches_written == 0:
+                # First batch uses replace to clear old tracks if updating
+                self.sp.playlist_replace_items(self._playlist_id, uris)
+            else:
+                self.sp.playlist_add_items(self._playlist_id, uris)
+            self._batches_written += 1
+            print(f"Batch {self._batches_written} streamed to '{self.playlist_name}'")
+        except Exception as e:
+            self._error = e
+
+    def finish(self):
+        # Writes the partial last batch, waits for the writer and returns the playlist URL (None if no tracks)
+        try:
+            if self._pending:
+                self._writes.append(self._writer.submit(self._write_batch, self._pending))
+                self._pending = []
+            for write in self._writes:
+                write.result()
+        finally:
+            self._writer.shutdown(wait=True)
+
+        if self._error:
+            raise self._error
+        if not self.track_ids:
+            return None
+
+        if self.user_key:
+            fingerprints.record_export(self.user_key, self.playlist_name, self.track_ids, self.playlist_url)
+        print(f"Done! Playlist URL: {self.playlist_url}")
+        return self.playlist_url
+
+    def abort(self):
+        # The scrape failed: stop writing. Batches already sent stay in the playlist.
+        self._error = self._error or RuntimeError("Export aborted")
+        self._writer.shutdown(wait=True)
@@ -0,0 +1,81 @@
+import os
+import json
+import threading
+import tempfile
+
+# Local state (subscriptions, export fingerprints, ...) lives in small JSON files.
+# On Vercel only /tmp is writable, so point SXMIFY_STATE_DIR there (or at a mounted volume).
+STATE_DIR = os.environ.get("SXMIFY_STATE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "state"))
+
+class JsonStore:
+    # A dict persisted to one JSON file. Reads are served from memory until another process rewrites
+    # the file (checked via mtime); every update rewrites the file atomically.
+
+    def __init__(self, filename, default=None):
+        self.filename = filename
+        self._default = default if default is not None else {}
+        self._lock = threading.RLock()
+        self._data = None
+        self._mtime = None
+        self._loaded_from = None
+
+    @property
+    def path(self):
+        # Resolved on every use so STATE_DIR can be changed after the stores are created (the tests do)
+        return os.path.join(STATE_DIR, self.filename)
+
+    def _load(self):
+        path = self.path
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            # Missing, or the state dir isn't usable (e.g. read-only deploys); treat as empty
+            mtime = None
+
+        if self._data is None or mtime != self._mtime or path != self._loaded_from:
+            self._mtime = mtime
+            self._loaded_from = path
+            try:
+                with open(path) as f:
+                    self._data = json.load(f)
+            except FileNotFoundError:
+                self._data = json.loads(json.dumps(self._default))
+            except OSError as e:
+                print(f"Warning: cannot read state file {path}: {e}")
+                self._data = json.loads(json.dumps(self._default))
+            except ValueError as e:
+                print(f"Warning: ignoring corrupt state file {path}: {e}")
+                self._data = json.loads(json.dumps(self._default))
+        return self._data
+
+    def _save(self):
+        path = self.path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self._data, f, indent=2)
+            os.replace(tmp_path, path)
+            self._mtime = os.stat(path).st_mtime_ns
+            self._loaded_from = path
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+    def read(self):
+        # Returns a deep copy so callers can't mutate the store behind its lock
+        with self._lock:
+            return json.loads(json.dumps(self._load()))
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._load().get(key, default)
+            return json.loads(json.dumps(value)) if value is not None else default
+
+    def update(self, fn):
+        # fn(data) mutates the loaded data in place and may return a value for the caller
+        with self._lock:
+            data = self._load()
+            result = fn(data)
+            self._save()
+            return result
@@ -0,0 +1,108 @@
+import os
+import time
+from state_store import JsonStore
+
+# Negative cache for (station, mode) feeds that came back empty or failed, with exponential backoff,
+# plus how many of each station's plays have a Spotify id. Persisted under SXMIFY_STATE_DIR so later
+# cron runs don't re-query feeds that are known to be dead; that needs a persistent state dir.
+
+# First retry after this long; each further failure doubles it up to the max
+BACKOFF_BASE_SECONDS = float(os.environ.get("NEGATIVE_CACHE_BASE", str(15 * 60)))
+# Kept well under the daily cron period, so a dead feed is always retried on the next day's run
+# even when the scheduler fires an hour early or late
+BACKOFF_MAX_SECONDS = float(os.environ.get("NEGATIVE_CACHE_MAX", str(22 * 3600)))
+
+# {"<station>|<mode>": {failures, retry_at, last_error, last_failure_at, last_success_at,
+#                        coverage: {seen, with_spotify, checked_at}}}
+_store = JsonStore('station_health.json')
+
+class FeedSkipped(Exception):
+    pass
+
+def _key(station_id, mode):
+    return f"{station_id}|{mode}"
+
+def _update(apply):
+    # Health data is advisory; an unwritable state dir must never fail the export that reported it
+    try:
+        return _store.update(apply)
+    except OSError as e:
+        print(f"Warning: could not save station health: {e}")
+        return None
+
+def backoff_seconds(failures):
+    return min(BACKOFF_BASE_SECONDS * 2 ** max(failures - 1, 0), BACKOFF_MAX_SECONDS)
+
+def skip_reason(station_id, mode):
+    # Returns a message if the feed is still backing off, else None
+    entry = _store.get(_key(station_id, mode))
+    if not entry or not entry.get('failures'):
+        return None
+    retry_in = entry.get('retry_at', 0) - time.time()
+    if retry_in <= 0:
+        return None
+    return (f"Skipped: {entry.get('last_error')} ({entry['failures']} attempt{'s' if entry['failures'] != 1 else ''} "
+            f"in a row), retrying in {format_duration(retry_in)}")
+
+def record_failure(station_id, mode, error):
+    now = time.time()
+
+    def apply(data):
+        entry = data.setdefault(_key(station_id, mode), {})
+        entry['failures'] = entry.get('failures', 0) + 1
+        entry['retry_at'] = now + backoff_seconds(entry['failures'])
+        entry['last_error'] = error
+        entry['last_failure_at'] = now
+        return entry['failures']
+    failures = _update(apply)
+    if failures:
+        print(f"Negative cache: {station_id} ({mode}) failed {failures}x, next try in {format_duration(backoff_seconds(failures))}")
+
+def record_success(station_id, mode):
+    def apply(data):
+        entry = data.setdefault(_key(station_id, mode), {})
+        entry['failures'] = 0
+        entry['retry_at'] = 0
+        entry['last_success_at'] = time.time()
+    _update(apply)
+
+def record_coverage(station_id, mode, seen, with_spotify):
+    # seen: plays returned by the API; with_spotify: those that had a Spotify id (the rest are dropped)
+    if not seen:
+        return
+
+    def apply(data):
+        entry = data.setdefault(_key(station_id, mode), {})
+        entry['coverage'] = {'seen': seen, 'with_spotify': with_spotify, 'checked_at': time.time()}
+        # Plays came back, so this was a successful upstream call for the station
+        entry['last_success_at'] = entry['coverage']['checked_at']
+    _update(apply)
+
+def coverage_pct(station_id, mode):
+    coverage = (_store.get(_key(station_id, mode)) or {}).get('coverage')
+    if not coverage or not coverage['seen']:
+        return None
+    return round(coverage['with_spotify'] * 100.0 / coverage['seen'], 1)
+
+def snapshot():
+    now = time.time()
+    feeds = {}
+    for key, entry in _store.read().items():
+        coverage = entry.get('coverage')
+        feeds[key] = {
+            'failures': entry.get('failures', 0),
+            'backing_off': entry.get('retry_at', 0) > now,
+            'retry_in_s': max(0, round(entry.get('retry_at', 0) - now)),
+            'last_error': entry.get('last_error'),
+            'last_success_s_ago': round(now - entry['last_success_at']) if entry.get('last_success_at') else None,
+            'last_failure_s_ago': round(now - entry['last_failure_at']) if entry.get('last_failure_at') else None,
+            'spotify_coverage_pct': round(coverage['with_spotify'] * 100.0 / coverage['seen'], 1) if coverage and coverage['seen'] else None
+        }
+    return feeds
+
+def format_duration(seconds):
+    if seconds >= 3600:
+        return f"{seconds / 3600:.1f}h"
+    if seconds >= 60:
+        return f"{seconds / 60:.0f}m"
+    return f"{seconds:.0f}s"
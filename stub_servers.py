@@ -0,0 +1,239 @@
+import re
+import json
+import time
+import random
+import uuid
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from spotify_client import spotify_for_token
+
+# Local stand-ins for the upstream APIs, used by bench.py and the load tests.
+# They keep connections alive like the real services and can add latency so network costs show up in measurements.
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default listen backlog of 5 drops connections when many requests start at once
+    request_queue_size = 128
+
+    def __init__(self, handler_class, latency_ms=0, handshake_ms=0, jitter_ms=0):
+        super().__init__(('127.0.0.1', 0), handler_class)
+        self.latency = latency_ms / 1000.0
+        # Random extra delay per request, so concurrent requests complete out of order like they do upstream
+        self.jitter = jitter_ms / 1000.0
+        # Paid once per new TCP connection, standing in for the TCP + TLS handshake round trips
+        self.handshake = handshake_ms / 1000.0
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Buffer each response into one write so Nagle/delayed-ACK stalls don't dominate the timings
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+        if self.server.handshake:
+            time.sleep(self.server.handshake)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _begin(self):
+        with self.server.lock:
+            self.server.requests += 1
+        if self.server.latency or self.server.jitter:
+            time.sleep(self.server.latency + random.uniform(0, self.server.jitter))
+        parsed = urlparse(self.path)
+        self.query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b""
+        if 'x-www-form-urlencoded' in self.headers.get('Content-Type', ''):
+            # OAuth token requests are form posts
+            self.body = {k: v[0] for k, v in parse_qs(body.decode()).items()}
+        else:
+            self.body = json.loads(body) if body else None
+        return parsed.path.rstrip('/') or '/'
+
+    def send_json(self, data, status=200):
+        payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_html(self, html, status=200):
+        payload = html.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        self.route('GET', self._begin())
+
+    def do_POST(self):
+        self.route('POST', self._begin())
+
+    def do_PUT(self):
+        self.route('PUT', self._begin())
+
+    def route(self, method, path):
+        self.send_json({'error': {'status': 404, 'message': 'Not found'}}, 404)
+
+class SpotifyStubHandler(StubHandler):
+    # Just enough of the Web API for create_playlist_and_add_tracks: profile, playlist search/create and item writes
+
+    def end_headers(self):
+        # Like Spotify, hand every caller a session cookie tied to its token
+        token = self.headers.get('Authorization', '')
+        self.send_header('Set-Cookie', f"sp_session={uuid.uuid5(uuid.NAMESPACE_OID, token).hex}; Path=/")
+        super().end_headers()
+
+    def route(self, method, path):
+        state = self.server.state
+        if self.headers.get('Cookie'):
+            with self.server.lock:
+                self.server.cookie_requests += 1
+        if method == 'POST' and path == '/api/token':
+            return self.send_json({'access_token': 'stub-access', 'token_type': 'Bearer', 'expires_in': 3600,
+                                   'scope': 'playlist-modify-public playlist-modify-private'})
+        if not self.headers.get('Authorization', '').startswith('Bearer '):
+            return self.send_json({'error': {'status': 401, 'message': 'No token provided'}}, 401)
+
+        if method == 'GET' and path == '/v1/me':
+            return self.send_json({'id': 'stub-user', 'display_name': 'Stub User', 'images': []})
+
+        if method == 'GET' and path == '/v1/me/playlists':
+            with self.server.lock:
+                items = [{'id': pid, 'name': p['name'], 'external_urls': {'spotify': p['url']}} for pid, p in state.items()]
+            offset, limit = int(self.query.get('offset', 0)), int(self.query.get('limit', 20))
+            return self.send_json({'items': items[offset:offset + limit], 'total': len(items)})
+
+        m = re.match(r'^/v1/users/[^/]+/playlists$', path)
+        if method == 'POST' and m:
+            pid = uuid.uuid4().hex[:22]
+            playlist = {'name': self.body['name'], 'url': f"https://open.spotify.com/playlist/{pid}",
+                        'items': [], 'snapshot': 0}
+            with self.server.lock:
+                state[pid] = playlist
+            return self.send_json({'id': pid, 'external_urls': {'spotify': playlist['url']}}, 201)
+
+        m = re.match(r'^/v1/playlists/([^/]+)(/items|/tracks)?$', path)
+        if not m or m.group(1) not in state:
+            return super().route(method, path)
+        playlist = state[m.group(1)]
+
+        if not m.group(2):
+            if method == 'PUT':
+                return self.send_json({})
+            return super().route(method, path)
+
+        with self.server.lock:
+            if method == 'GET':
+                offset, limit = int(self.query.get('offset', 0)), int(self.query.get('limit', 100))
+                page = playlist['items'][offset:offset + limit]
+                return self.send_json({'items': [{'track': {'uri': uri}} for uri in page],
+                                       'total': len(playlist['items']), 'offset': offset, 'limit': limit})
+            if method == 'POST':
+                uris = self.body if isinstance(self.body, list) else self.body.get('uris', [])
+                position = self.query.get('position')
+                if position is None:
+                    playlist['items'].extend(uris)
+                else:
+                    position = int(position)
+                    if position > len(playlist['items']):
+                        return self.send_json({'error': {'status': 400, 'message': 'Index out of bounds'}}, 400)
+                    playlist['items'][position:position] = uris
+            elif method == 'PUT' and 'uris' in self.body:
+                playlist['items'] = list(self.body['uris'])
+            elif method == 'PUT':
+                start, length = self.body['range_start'], self.body.get('range_length', 1)
+                before = self.body['insert_before']
+                items = playlist['items']
+                moved = items[start:start + length]
+                rest = items[:start] + items[start + length:]
+                if before > start:
+                    before -= length
+                playlist['items'] = rest[:before] + moved + rest[before:]
+            playlist['snapshot'] += 1
+            return self.send_json({'snapshot_id': f"snap-{playlist['snapshot']}"}, 201 if method == 'POST' else 200)
+
+class XmplaylistStubHandler(StubHandler):
+    # The station list page and the JSON API endpoints scraper.py reads, with deterministic tracks
+    PAGE_SIZE = 50
+
+    def route(self, method, path):
+        server = self.server
+        if method != 'GET':
+            return super().route(method, path)
+
+        if path == '/station':
+            links = ''.join(
+                f'<a href="/station/{sid}"><div class="absolute text-slate-500">{n}</div><div class="truncate">{sid.title()}</div></a>'
+                for n, sid in enumerate(server.stations, 1))
+            return self.send_html(f"<html><body>{links}</body></html>")
+
+        if server.blocked_status:
+            # Stands in for the upstream turning us away (403/429) or falling over (5xx)
+            return self.send_json({'detail': 'Blocked'}, server.blocked_status)
+
+        m = re.match(r'^/api/station/([a-zA-Z0-9]+)(/newest|/most-heard)?$', path)
+        if not m or m.group(1) not in server.stations:
+            return super().route(method, path)
+        station = m.group(1)
+
+        if m.group(2):
+            return self.send_json({'results': [self.track(station, i) for i in range(100)]})
+
+        page = int(self.query.get('page', 1))
+        start = (page - 1) * self.PAGE_SIZE
+        results = [self.track(station, i) for i in range(start, start + self.PAGE_SIZE)]
+        # Absolute http link, like the real API's next field
+        next_url = f"{server.url}/api/station/{station}?page={page + 1}" if page < server.pages else None
+        return self.send_json({'results': results, 'next': next_url})
+
+    def track(self, station, i):
+        return {
+            'track': {'title': f"Song {i}", 'artists': [f"{station.title()} Artist {i % 17}"]},
+            'spotify': {'id': f"{station}{i:05d}", 'albumImageSmall': None}
+        }
+
+def start_xmplaylist_stub(latency_ms=0, handshake_ms=0, jitter_ms=0, stations=40, pages=6):
+    server = StubServer(XmplaylistStubHandler, latency_ms, handshake_ms, jitter_ms)
+    server.stations = [f"station{n}" for n in range(1, stations + 1)]
+    server.pages = pages
+    server.blocked_status = None
+    return server.start()
+
+def start_spotify_stub(latency_ms=0, handshake_ms=0, jitter_ms=0):
+    server = StubServer(SpotifyStubHandler, latency_ms, handshake_ms, jitter_ms)
+    server.state = {}
+    server.cookie_requests = 0
+    return server.start()
+
+def stub_client(stub):
+    # A Spotify client whose API calls go to a start_spotify_stub() server
+    sp = spotify_for_token("test-token")
+    sp.prefix = f"{stub.url}/v1/"
+    return sp
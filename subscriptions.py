@@ -0,0 +1,171 @@
+import os
+import uuid
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from cryptography.fernet import Fernet
+from scraper import scrape_tracks, build_scrape_url
+from spotify_client import create_playlist_and_add_tracks, spotify_for_token
+from state_store import JsonStore
+
+VALID_MODES = ('recent', 'newest', 'most_heard')
+
+# Fernet key (Fernet.generate_key()) that subscriber refresh tokens are encrypted with on disk.
+# Without it users can't register, so no token is ever stored in the clear.
+TOKEN_KEY = os.environ.get("SUBSCRIPTION_TOKEN_KEY")
+
+# {"users": {user_id: {encrypted_refresh_token, display_name}}, "subscriptions": [{id, user_id, station, mode, days, limit, name}]}
+_store = JsonStore('subscriptions.json', default={'users': {}, 'subscriptions': []})
+
+def _fernet():
+    if not TOKEN_KEY:
+        raise ValueError("Subscriptions are not enabled on this server (SUBSCRIPTION_TOKEN_KEY is not set)")
+    return Fernet(TOKEN_KEY)
+
+def register_user(user_id, refresh_token, display_name=None):
+    encrypted = _fernet().encrypt(refresh_token.encode()).decode()
+
+    def apply(data):
+        user = data['users'].setdefault(user_id, {})
+        user.pop('refresh_token', None)
+        user['encrypted_refresh_token'] = encrypted
+        user['display_name'] = display_name
+    _store.update(apply)
+
+def _refresh_token(user):
+    if 'refresh_token' in user:
+        # Saved before tokens were encrypted; _client_for_user re-saves it encrypted
+        return user['refresh_token']
+    return _fernet().decrypt(user['encrypted_refresh_token'].encode()).decode()
+
+def add_subscription(user_id, station, mode='recent', days=None, limit=100, name=None):
+    if mode not in VALID_MODES:
+        raise ValueError(f"Unknown mode '{mode}'")
+    days = str(days or 7) if mode == 'most_heard' else None
+    limit = max(1, min(int(limit), 500))
+
+    def apply(data):
+        if user_id not in data['users']:
+            raise ValueError(f"User {user_id} is not registered")
+        # Re-subscribing to the same feed just updates its options
+        for sub in data['subscriptions']:
+            if (sub['user_id'], sub['station'], sub['mode'], sub['days']) == (user_id, station, mode, days):
+                sub['limit'] = limit
+                sub['name'] = name or None
+                return sub
+        sub = {
+            'id': uuid.uuid4().hex[:12],
+            'user_id': user_id,
+            'station': station,
+            'mode': mode,
+            'days': days,
+            'limit': limit,
+            'name': name or None,
+            'created_at': datetime.datetime.now().isoformat(timespec='seconds')
+        }
+        data['subscriptions'].append(sub)
+        return sub
+    return _store.update(apply)
+
+def remove_subscription(user_id, sub_id):
+    def apply(data):
+        before = len(data['subscriptions'])
+        data['subscriptions'] = [s for s in data['subscriptions'] if not (s['id'] == sub_id and s['user_id'] == user_id)]
+        return len(data['subscriptions']) != before
+    return _store.update(apply)
+
+def list_subscriptions(user_id=None):
+    subs = _store.read()['subscriptions']
+    if user_id:
+        subs = [s for s in subs if s['user_id'] == user_id]
+    return subs
+
+def group_subscriptions(subs):
+    # One scrape per distinct (station, mode, days), big enough for the largest subscriber limit
+    groups = {}
+    for sub in subs:
+        groups.setdefault((sub['station'], sub['mode'], sub['days']), []).append(sub)
+    return groups
+
+def _scrape_group(key, subs):
+    station, mode, days = key
+    limit = max(s['limit'] for s in subs)
+    try:
+        tracks = scrape_tracks(build_scrape_url(station, mode, days), limit=limit)
+        return [t['id'] for t in tracks], None
+    except Exception as e:
+        return [], str(e)
+
+def _client_for_user(sp_oauth, user_id, user):
+    refresh_token = _refresh_token(user)
+    token_info = sp_oauth.refresh_access_token(refresh_token)
+    new_refresh = token_info.get('refresh_token') or refresh_token
+    if new_refresh != refresh_token or 'refresh_token' in user:
+        # Spotify may rotate refresh tokens; keep the latest one or the next cycle will fail
+        try:
+            register_user(user_id, new_refresh, user.get('display_name'))
+        except OSError as e:
+            print(f"Warning: could not save the refresh token for {user_id}: {e}")
+    return spotify_for_token(token_info['access_token'])
+
+def run_subscription_cycle(sp_oauth, station_names=None, stations=None, max_workers=4):
+    """Scrape each distinct feed once, then write it to every subscriber's playlist."""
+    data = _store.read()
+    subs = data['subscriptions']
+    if stations:
+        subs = [s for s in subs if s['station'] in stations]
+    station_names = station_names or {}
+
+    groups = group_subscriptions(subs)
+    print(f"Subscription cycle: {len(subs)} subscriptions, {len(groups)} distinct scrapes")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        scraped = dict(zip(groups, pool.map(lambda item: _scrape_group(*item), groups.items())))
+
+        clients = {}
+        for user_id in {s['user_id'] for s in subs}:
+            try:
+                clients[user_id] = _client_for_user(sp_oauth, user_id, data['users'][user_id])
+            except Exception as e:
+                print(f"Could not authenticate subscriber {user_id}: {e}")
+                clients[user_id] = e
+
+        def write(key, sub):
+            station, mode, days = key
+            track_ids, scrape_error = scraped[key]
+            result = {
+                'subscription_id': sub['id'],
+                'user_id': sub['user_id'],
+                'station': station,
+                'mode': mode,
+                'success': False,
+                'tracks_added': 0,
+                'playlist_url': None,
+                'error': None
+            }
+            sp = clients[sub['user_id']]
+            if isinstance(sp, Exception):
+                result['error'] = f"Spotify authentication failed: {sp}"
+            elif not track_ids:
+                result['error'] = scrape_error or f"No tracks found for station {station}"
+            else:
+                try:
+                    track_ids = track_ids[:sub['limit']]
+                    result['playlist_url'] = create_playlist_and_add_tracks(
+                        sp, track_ids, station, mode, days, station_names.get(station), sub['name'],
+                        user_key=sub['user_id']
+                    )
+                    result['tracks_added'] = len(track_ids)
+                    result['success'] = True
+                except Exception as e:
+                    result['error'] = str(e)
+            return result
+
+        futures = [pool.submit(write, key, sub) for key, group in groups.items() for sub in group]
+        results = [f.result() for f in futures]
+
+    return {
+        'subscriptions': len(subs),
+        'users': len(clients),
+        'scrapes': len(groups),
+        'results': results
+    }
@@ -0,0 +1,110 @@
+import time
+import asyncio
+from urllib.parse import urlencode
+import spotipy.oauth2
+import app
+import asgi
+import scraper
+import cache_warmer
+import spotify_async
+from circuit_breaker import CircuitBreaker
+from stub_servers import start_xmplaylist_stub, start_spotify_stub
+
+async def call(method, path, form=None, cookie=None):
+    # One request through the ASGI app, the way uvicorn would deliver it; returns (status, headers, body)
+    path, _, query = path.partition('?')
+    headers = [(b'host', b'testserver')]
+    body = urlencode(form, doseq=True).encode() if form else b''
+    if form:
+        headers += [(b'content-type', b'application/x-www-form-urlencoded'), (b'content-length', str(len(body)).encode())]
+    if cookie:
+        headers.append((b'cookie', f"spotify-login-session={cookie}".encode()))
+    scope = {'type': 'http', 'http_version': '1.1', 'method': method, 'scheme': 'http', 'path': path,
+             'query_string': query.encode(), 'root_path': '', 'headers': headers,
+             'server': ('testserver', 80), 'client': ('127.0.0.1', 50000)}
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    await asgi.app(scope, receive, send)
+    return sent[0]['status'], dict(sent[0]['headers']), sent[1]['body'].decode()
+
+def session_cookie(data):
+    return app.app.session_interface.get_signing_serializer(app.app).dumps(data)
+
+def quiet_app(monkeypatch, xmplaylist):
+    monkeypatch.setattr(cache_warmer, 'WARMER_ENABLED', False)
+    monkeypatch.setattr(cache_warmer, 'cache', cache_warmer.ScrapeCache())
+    monkeypatch.setattr(scraper, 'xmplaylist_breaker', CircuitBreaker('xmplaylist.com'))
+    monkeypatch.setattr(scraper, 'XMPLAYLIST_BASE_URL', xmplaylist.url)
+    monkeypatch.setattr(scraper, 'STATION_LIST_URL', f"{xmplaylist.url}/station")
+
+def test_async_views_share_one_event_loop(monkeypatch):
+    xmplaylist = start_xmplaylist_stub(latency_ms=200, stations=64)
+    try:
+        quiet_app(monkeypatch, xmplaylist)
+
+        async def scrape_all():
+            return await asyncio.gather(*(
+                call('POST', '/scrape', {'url': f"{xmplaylist.url}/station/{sid}", 'scrape_type': 'newest', 'limit': '20'})
+                for sid in xmplaylist.stations))
+
+        # 64 requests each waiting 200ms on xmplaylist: more than the default thread pool has threads,
+        # so this only finishes in about one round trip if none of them holds a thread while it waits
+        start = time.perf_counter()
+        responses = asyncio.run(scrape_all())
+        assert time.perf_counter() - start < 1.0
+        assert [status for status, _, _ in responses] == [200] * 64
+        assert all(body.count('name="track_ids"') == 20 for _, _, body in responses)
+        assert xmplaylist.requests == 64
+    finally:
+        xmplaylist.stop()
+
+def test_sync_routes_and_redirects_still_work(monkeypatch):
+    xmplaylist = start_xmplaylist_stub(stations=3)
+    try:
+        quiet_app(monkeypatch, xmplaylist)
+
+        status, headers, body = asyncio.run(call('GET', '/health'))
+        assert status == 200 and headers[b'content-type'] == b'application/json'
+        assert '"status":"ok"' in body.replace(' ', '')
+
+        # An async view redirecting, and the session it set read back by the next request
+        status, headers, _ = asyncio.run(call('GET', '/review'))
+        assert (status, headers[b'location']) == (302, b'/')
+
+        status, _, body = asyncio.run(call('GET', '/'))
+        assert status == 200 and body.count('class="station-option"') == 3
+        assert asyncio.run(call('GET', '/nowhere'))[0] == 404
+    finally:
+        xmplaylist.stop()
+
+def test_export_refreshes_the_token_and_writes_the_playlist(monkeypatch):
+    spotify = start_spotify_stub()
+    try:
+        monkeypatch.setattr(cache_warmer, 'WARMER_ENABLED', False)
+        monkeypatch.setattr(spotify_async, 'SPOTIFY_API_PREFIX', f"{spotify.url}/v1/")
+        monkeypatch.setattr(spotipy.oauth2.SpotifyOAuth, 'OAUTH_TOKEN_URL', f"{spotify.url}/api/token")
+        monkeypatch.setattr(app, 'SPOTIPY_CLIENT_ID', 'test')
+        monkeypatch.setattr(app, 'SPOTIPY_CLIENT_SECRET', 'test')
+        expired = session_cookie({'user_id': 'stub-user', 'token_info': {
+            'access_token': 'old', 'refresh_token': 'refresh', 'token_type': 'Bearer', 'expires_at': 0,
+            'scope': 'playlist-modify-public playlist-modify-private'}})
+
+        track_ids = [f"track{i}" for i in range(250)]
+        status, headers, body = asyncio.run(call('POST', '/export', {'track_ids': track_ids, 'station_id': 'lithium'},
+                                                 cookie=expired))
+        assert status == 200 and 'Open in Spotify' in body
+        # The refreshed token went back into the session cookie
+        assert b'spotify-login-session=' in headers[b'set-cookie']
+
+        [playlist] = spotify.state.values()
+        assert playlist['name'] == "XM: Lithium - Recently Played"
+        assert playlist['items'] == [f"spotify:track:{tid}" for tid in track_ids]
+    finally:
+        spotify.stop()
@@ -0,0 +1,44 @@
+import scraper
+import cache_warmer
+from cache_warmer import ScrapeCache, STATIONS_KEY
+
+def test_entries_expire_and_respect_limits(clock):
+    cache = ScrapeCache(clock=clock)
+    key = ('lithium', 'recent', None)
+    cache.set(key, [{'id': str(i)} for i in range(50)], ttl=60, limit=50)
+
+    assert len(cache.get(key, 20)) == 20
+    # 100 requested but only 50 cached from a 50-track scrape: not answerable
+    assert cache.get(key, 100) is None
+    # A feed that returned fewer tracks than asked for is complete at any larger limit
+    cache.set(key, [{'id': '1'}], ttl=60, limit=50)
+    assert cache.get(key, 100) == [{'id': '1'}]
+
+    clock.now += 61
+    assert cache.get(key, 20) is None
+
+def test_warmer_refreshes_hot_feeds_before_expiry(clock, monkeypatch):
+    cache = ScrapeCache(clock=clock)
+    scrapes = []
+    monkeypatch.setattr(scraper, 'get_stations', lambda: [{'id': 'lithium'}])
+    monkeypatch.setattr(scraper, 'scrape_tracks', lambda url, limit: scrapes.append((url, limit)) or [{'id': 'a'}])
+
+    hot = ('lithium', 'recent', None)
+    cold = ('octane', 'recent', None)
+    for _ in range(3):
+        cache.record_request(hot, 100)
+    cache.record_request(cold, 100)
+
+    assert cache.warm_once() == [STATIONS_KEY, hot]
+    assert scrapes == [('https://xmplaylist.com/station/lithium', 100)]
+
+    # Nothing is close to expiring yet
+    assert cache.warm_once() == []
+
+    clock.now += cache_warmer.SCRAPE_TTL - cache_warmer.WARM_AHEAD + 1
+    assert cache.warm_once() == [hot]
+    assert cache.get(hot, 100) == [{'id': 'a'}]
+
+    # Popularity decays: a day later the feed is no longer hot
+    clock.now += 24 * 3600
+    assert cache.hot_feeds() == []
@@ -0,0 +1,44 @@
+from circuit_breaker import CircuitBreaker, CircuitOpenError, CLOSED, OPEN, HALF_OPEN
+
+def test_opens_after_error_spike_and_recovers(clock):
+    breaker = CircuitBreaker('test', failure_threshold=0.5, min_calls=4, cooldown_seconds=30, clock=clock)
+
+    breaker.record_success()
+    breaker.record_failure("boom")
+    breaker.record_failure("boom")
+    assert breaker.state == CLOSED  # not enough calls yet
+
+    breaker.record_failure("boom")
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    try:
+        breaker.check()
+        assert False, "expected CircuitOpenError"
+    except CircuitOpenError:
+        pass
+
+    clock.now += 31
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()       # the probe
+    assert not breaker.allow()   # everyone else still fails fast
+    breaker.record_success()
+    assert breaker.state == CLOSED
+
+def test_failed_probe_reopens(clock):
+    breaker = CircuitBreaker('test', min_calls=1, cooldown_seconds=10, clock=clock)
+    breaker.record_failure("boom")
+    assert breaker.state == OPEN
+
+    clock.now += 11
+    assert breaker.allow()
+    breaker.record_failure("still down")
+    assert breaker.state == OPEN
+    assert breaker.snapshot()['retry_in'] == 10
+
+def test_old_failures_age_out(clock):
+    breaker = CircuitBreaker('test', min_calls=4, window_seconds=60, clock=clock)
+    for _ in range(3):
+        breaker.record_failure("boom")
+    clock.now += 120
+    breaker.record_failure("boom")
+    assert breaker.state == CLOSED
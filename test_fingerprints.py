@@ -0,0 +1,53 @@
+import fingerprints
+import state_store
+from spotify_client import create_playlist_and_add_tracks
+
+class FakeSpotify:
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self.calls.append(name)
+            if name == 'current_user':
+                return {'id': 'me'}
+            if name == 'current_user_playlists':
+                return {'items': []}
+            if name == 'user_playlist_create':
+                return {'id': 'pl1', 'external_urls': {'spotify': 'https://open.spotify.com/playlist/pl1'}}
+            return {}
+        return call
+
+def test_unchanged_export_skips_spotify():
+    sp = FakeSpotify()
+    url = create_playlist_and_add_tracks(sp, ['a', 'b', 'c'], 'lithium', user_key='me')
+    assert url == 'https://open.spotify.com/playlist/pl1'
+    assert 'playlist_replace_items' in sp.calls
+
+    sp.calls.clear()
+    assert create_playlist_and_add_tracks(sp, ['a', 'b', 'c'], 'lithium', user_key='me') == url
+    assert sp.calls == []
+
+    # A different order is a different playlist
+    create_playlist_and_add_tracks(sp, ['c', 'b', 'a'], 'lithium', user_key='me')
+    assert 'playlist_replace_items' in sp.calls
+
+    # No user key: always writes
+    sp.calls.clear()
+    create_playlist_and_add_tracks(sp, ['c', 'b', 'a'], 'lithium')
+    assert 'playlist_replace_items' in sp.calls
+
+    # Forced writes still go out and keep the fingerprint current
+    sp.calls.clear()
+    create_playlist_and_add_tracks(sp, ['c', 'b', 'a'], 'lithium', user_key='me', skip_unchanged=False)
+    assert 'playlist_replace_items' in sp.calls
+    assert fingerprints.unchanged_playlist_url('me', 'XM: Lithium - Recently Played', ['c', 'b', 'a']) == url
+
+def test_unusable_fingerprint_store_still_exports(tmp_path, monkeypatch):
+    blocker = tmp_path / 'not-a-dir'
+    blocker.write_text('')
+    monkeypatch.setattr(state_store, 'STATE_DIR', str(blocker))
+
+    sp = FakeSpotify()
+    assert create_playlist_and_add_tracks(sp, ['a'], 'lithium', user_key='me') == 'https://open.spotify.com/playlist/pl1'
+    assert 'playlist_replace_items' in sp.calls
@@ -0,0 +1,75 @@
+import time
+import health
+import scraper
+import station_health
+from circuit_breaker import CircuitBreaker
+
+def reset_upstream(monkeypatch):
+    monkeypatch.setattr(scraper, 'xmplaylist_breaker', CircuitBreaker('xmplaylist.com'))
+    monkeypatch.setattr(health, '_last_probe', None)
+
+def test_report_uses_collected_state_only(monkeypatch):
+    reset_upstream(monkeypatch)
+
+    def no_upstream(*args, **kwargs):
+        raise AssertionError("health report made an upstream call")
+    monkeypatch.setattr(scraper, 'upstream_get', no_upstream)
+    monkeypatch.setattr(scraper, 'upstream_get_json', no_upstream)
+
+    station_health.record_coverage('lithium', 'recent', seen=20, with_spotify=20)
+    station_health.record_failure('deadstation', 'recent', "No tracks found")
+    health.record_cron_run('/api/cron/update', time.time() - 3, 200, {'results': [
+        {'success': True, 'station': 'Lithium'},
+        {'station': 'deadstation', 'error': "No tracks found"}
+    ]})
+
+    report = health.report()
+    assert report['status'] == 'ok'
+    assert report['stations']['lithium|recent']['last_success_s_ago'] == 0
+    assert report['stations']['deadstation|recent']['last_failure_s_ago'] == 0
+    cron = report['cron']['/api/cron/update']
+    assert (cron['ok'], cron['results'], cron['failed'], cron['last_ok_s_ago']) == (True, 2, 1, 0)
+
+    # A job that failed outright degrades the report; the last good run is still reported
+    health.record_cron_run('/api/cron/update', time.time(), 500, {'error': "Failed to refresh Spotify token"})
+    report = health.report()
+    assert report['status'] == 'degraded'
+    assert report['problems'] == ["last /api/cron/update run failed: Failed to refresh Spotify token"]
+    assert report['cron']['/api/cron/update']['last_ok_s_ago'] == 0
+
+def test_probe_is_rate_limited(monkeypatch):
+    reset_upstream(monkeypatch)
+    monkeypatch.setattr(health, 'PROBE_MIN_INTERVAL', 300)
+    probes = []
+    monkeypatch.setattr(health, '_probe_upstream', lambda: probes.append(1) or {'ok': True, 'checks': {}})
+
+    result, retry_in = health.run_probe()
+    assert result['ok'] and retry_in == 0
+    result, retry_in = health.run_probe()
+    assert len(probes) == 1
+    assert 299 < retry_in <= 300
+    assert health.report()['last_probe'] == {'s_ago': 0, 'ok': True}
+
+    monkeypatch.setattr(health, 'PROBE_MIN_INTERVAL', 0)
+    health.run_probe()
+    assert len(probes) == 2
+
+def test_merged_run_fails_when_its_playlist_write_fails(monkeypatch):
+    reset_upstream(monkeypatch)
+    stations = [{'station_name': 'Lithium', 'success': True, 'track_count': 100},
+                {'station_name': 'Octane', 'success': True, 'track_count': 100}]
+    health.record_cron_run('/api/cron/update', time.time(), 200, {
+        'merged': {'station_name': 'XM Mix: Lithium + Octane - Recently Played', 'success': False,
+                   'error': "http://api.spotify.com/v1/playlists/x/items:\n Server error"},
+        'results': stations
+    })
+    cron = health.report()['cron']['/api/cron/update']
+    assert (cron['ok'], cron['results'], cron['failed']) == (False, 2, 1)
+    assert cron['error'].endswith("Server error")
+
+    health.record_cron_run('/api/cron/update', time.time(), 200, {
+        'merged': {'station_name': 'XM Mix: Lithium + Octane - Recently Played', 'success': True, 'error': None},
+        'results': stations
+    })
+    cron = health.report()['cron']['/api/cron/update']
+    assert (cron['ok'], cron['failed'], cron['error']) == (True, 0, None)
@@ -0,0 +1,52 @@
+import pytest
+from main import load_jobs, normalize_job, batch, parse_args
+
+DEFAULTS = {'mode': 'recent', 'days': None, 'limit': 100}
+
+def test_load_jobs_reads_stations_and_urls(tmp_path):
+    jobs_file = tmp_path / 'jobs.jsonl'
+    jobs_file.write_text('# nightly\n'
+                         '{"station": "lithium", "limit": 50}\n'
+                         '\n'
+                         '{"url": "https://xmplaylist.com/station/altnation/newest", "name": "Alt"}\n')
+    assert load_jobs(str(jobs_file)) == [
+        {'station': 'lithium', 'limit': 50},
+        {'url': 'https://xmplaylist.com/station/altnation/newest', 'name': 'Alt'},
+    ]
+
+def test_load_jobs_reports_the_bad_line(tmp_path):
+    jobs_file = tmp_path / 'jobs.jsonl'
+    jobs_file.write_text('{"station": "lithium"}\n{"station": \n')
+    with pytest.raises(ValueError, match=r"jobs\.jsonl:2: invalid JSON"):
+        load_jobs(str(jobs_file))
+
+    jobs_file.write_text('{"station": "lithium"}\n\n{"mode": "newest"}\n')
+    with pytest.raises(ValueError, match=r"jobs\.jsonl:3: job needs a 'station' or 'url'"):
+        load_jobs(str(jobs_file))
+
+def test_station_id_uses_the_defaults():
+    job = normalize_job({'station': 'lithium'}, {'mode': 'most_heard', 'days': None, 'limit': 100})
+    assert job == {'url': 'https://xmplaylist.com/station/lithium/most-heard?days=7', 'station_id': 'lithium',
+                   'mode': 'most_heard', 'days': '7', 'limit': 100, 'name': None}
+
+def test_url_overrides_mode_and_days():
+    job = normalize_job({'url': 'https://xmplaylist.com/station/altnation/most-heard?days=30', 'mode': 'recent', 'days': 1},
+                        DEFAULTS)
+    assert (job['station_id'], job['mode'], job['days']) == ('altnation', 'most_heard', '30')
+    assert job['url'] == 'https://xmplaylist.com/station/altnation/most-heard?days=30'
+
+    job = normalize_job({'url': 'https://xmplaylist.com/station/altnation/newest/', 'limit': '20'}, DEFAULTS)
+    assert (job['station_id'], job['mode'], job['days'], job['limit']) == ('altnation', 'newest', None, 20)
+
+def test_bad_jobs_are_rejected():
+    with pytest.raises(ValueError, match="Unknown mode 'loudest'"):
+        normalize_job({'station': 'lithium', 'mode': 'loudest'}, DEFAULTS)
+    with pytest.raises(ValueError, match="Could not determine station"):
+        normalize_job({'url': 'https://xmplaylist.com/'}, DEFAULTS)
+
+def test_batch_stops_on_a_bad_job_file_before_spotify(tmp_path, monkeypatch, capsys):
+    monkeypatch.delenv('SPOTIPY_CLIENT_ID', raising=False)
+    jobs_file = tmp_path / 'jobs.jsonl'
+    jobs_file.write_text('{"station": "lithium"}\nnot json\n')
+    assert batch(parse_args(['--jobs', str(jobs_file)])) == 2
+    assert 'jobs.jsonl:2: invalid JSON' in capsys.readouterr().out
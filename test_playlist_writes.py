@@ -0,0 +1,77 @@
+from stub_servers import start_spotify_stub, stub_client
+from spotify_client import create_playlist_and_add_tracks, spotify_session
+
+def test_parallel_write_keeps_exact_order():
+    # Jitter makes the concurrent appends finish out of order, forcing the ordering pass
+    stub = start_spotify_stub(jitter_ms=20)
+    try:
+        sp = stub_client(stub)
+        track_ids = [f"track{i:04d}" for i in range(1250)]
+        url = create_playlist_and_add_tracks(sp, track_ids, 'lithium', parallel=True)
+
+        (playlist,) = stub.state.values()
+        assert url == playlist['url']
+        assert playlist['items'] == [f"spotify:track:{tid}" for tid in track_ids]
+
+        # Rewriting an existing playlist replaces its contents
+        create_playlist_and_add_tracks(sp, track_ids[:730][::-1], 'lithium', parallel=True)
+        assert len(stub.state) == 1
+        assert playlist['items'] == [f"spotify:track:{tid}" for tid in track_ids[:730][::-1]]
+    finally:
+        stub.stop()
+
+def test_serial_and_parallel_agree_on_short_playlists():
+    stub = start_spotify_stub()
+    try:
+        sp = stub_client(stub)
+        track_ids = [f"track{i}" for i in range(150)]
+        create_playlist_and_add_tracks(sp, track_ids, 'a', parallel=True)
+        create_playlist_and_add_tracks(sp, track_ids, 'b', parallel=False)
+        first, second = stub.state.values()
+        assert first['items'] == second['items'] == [f"spotify:track:{tid}" for tid in track_ids]
+    finally:
+        stub.stop()
+
+def test_extra_trailing_items_fail_verification():
+    stub = start_spotify_stub()
+    try:
+        sp = stub_client(stub)
+        track_ids = [f"track{i:04d}" for i in range(450)]
+        add_items = sp.playlist_add_items
+        retried = []
+
+        def add_tail_twice(playlist_id, items, position=None):
+            # Like a POST the retry policy resent after Spotify had already applied it
+            add_items(playlist_id, items, position)
+            if len(items) < 100 and not retried:
+                retried.append(1)
+                add_items(playlist_id, items, position)
+        sp.playlist_add_items = add_tail_twice
+
+        create_playlist_and_add_tracks(sp, track_ids, 'lithium', parallel=True)
+        (playlist,) = stub.state.values()
+        assert retried
+        assert playlist['items'] == [f"spotify:track:{tid}" for tid in track_ids]
+    finally:
+        stub.stop()
+
+def test_parallel_writes_are_opt_in():
+    stub = start_spotify_stub()
+    try:
+        sp = stub_client(stub)
+        create_playlist_and_add_tracks(sp, [f"track{i}" for i in range(1000)], 'lithium')
+        assert stub.requests == 13  # user, playlist lookup, create, then 10 serial batches
+    finally:
+        stub.stop()
+
+def test_shared_session_keeps_no_cookies():
+    stub = start_spotify_stub()
+    try:
+        create_playlist_and_add_tracks(stub_client(stub), ['a', 'b'], 'lithium')
+        other = stub_client(stub)
+        other._auth = "another-users-token"
+        create_playlist_and_add_tracks(other, ['c'], 'lithium')
+        assert stub.cookie_requests == 0
+        assert len(spotify_session.cookies) == 0
+    finally:
+        stub.stop()
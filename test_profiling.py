@@ -0,0 +1,36 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+import profiling
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        sum(range(1000))
+
+def test_profiled_runs_are_saved_and_ranked(state_dir, monkeypatch):
+    monkeypatch.setattr(profiling, 'PROFILE_DIR', str(state_dir / 'profiles'))
+
+    fast = profiling.start('GET /fast')
+    profiling.finish(fast, 200)
+
+    slow = profiling.start('GET /api/cron/update', kind='cron')
+    # Work handed to a thread is attributed to the run too
+    with profiling.handed_off(), ThreadPoolExecutor(max_workers=1) as pool:
+        pool.submit(profiling.in_profile(busy), 0.2).result()
+    profiling.finish(slow, 200)
+    # With nothing left to profile the sampler goes back to sleep
+    assert not profiling._has_active.is_set()
+
+    runs = profiling.slowest_runs()
+    assert [r['label'] for r in runs] == ['GET /api/cron/update', 'GET /fast']
+    assert [r['label'] for r in profiling.slowest_runs(kind='cron')] == ['GET /api/cron/update']
+    assert runs[0]['top'][0]['function'].startswith('busy (test_profiling.py')
+    with open(runs[0]['file']) as f:
+        assert 'busy (test_profiling.py' in f.read()
+
+def test_sampling_rates(monkeypatch):
+    monkeypatch.setattr(profiling, 'PROFILE_SAMPLE_RATE', 0)
+    monkeypatch.setattr(profiling, 'PROFILE_CRON_SAMPLE_RATE', 1)
+    assert not profiling.should_profile('request')
+    assert profiling.should_profile('request', forced=True)
+    assert profiling.should_profile('cron')
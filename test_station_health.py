@@ -0,0 +1,43 @@
+import os
+import time
+import state_store
+import station_health
+
+def test_failures_back_off_exponentially(monkeypatch):
+    monkeypatch.setattr(station_health, 'BACKOFF_BASE_SECONDS', 60)
+    monkeypatch.setattr(station_health, 'BACKOFF_MAX_SECONDS', 300)
+    assert [station_health.backoff_seconds(n) for n in (1, 2, 3, 4)] == [60, 120, 240, 300]
+
+    assert station_health.skip_reason('deadstation', 'recent') is None
+    station_health.record_failure('deadstation', 'recent', "No tracks found")
+    station_health.record_failure('deadstation', 'recent', "No tracks found")
+    reason = station_health.skip_reason('deadstation', 'recent')
+    assert reason.startswith("Skipped: No tracks found (2 attempts in a row)")
+    # Other modes of the same station are tracked separately
+    assert station_health.skip_reason('deadstation', 'newest') is None
+
+    # Once the retry time passes the feed is tried again, and a success clears it
+    monkeypatch.setattr(time, 'time', lambda: 10 ** 10)
+    assert station_health.skip_reason('deadstation', 'recent') is None
+    station_health.record_success('deadstation', 'recent')
+    assert station_health.snapshot()['deadstation|recent']['failures'] == 0
+
+def test_spotify_coverage():
+    assert station_health.coverage_pct('lithium', 'recent') is None
+    station_health.record_coverage('lithium', 'recent', seen=50, with_spotify=40)
+    assert station_health.coverage_pct('lithium', 'recent') == 80.0
+    assert station_health.snapshot()['lithium|recent']['spotify_coverage_pct'] == 80.0
+
+def test_unusable_state_dir_is_not_fatal(tmp_path, monkeypatch):
+    # e.g. a read-only deploy: nothing is saved, but exports carry on and this process still backs off
+    blocker = tmp_path / 'not-a-dir'
+    blocker.write_text('')
+    monkeypatch.setattr(state_store, 'STATE_DIR', str(blocker))
+
+    station_health.record_failure('lithium', 'recent', "No tracks found")
+    assert station_health.skip_reason('lithium', 'recent')
+    station_health.record_coverage('lithium', 'recent', seen=10, with_spotify=5)
+    station_health.record_success('lithium', 'recent')
+    assert station_health.skip_reason('lithium', 'recent') is None
+    assert station_health.coverage_pct('lithium', 'recent') == 50.0
+    assert not os.path.exists(station_health._store.path)
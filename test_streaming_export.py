@@ -0,0 +1,36 @@
+from stub_servers import start_spotify_stub, stub_client
+from spotify_client import PlaylistStream
+
+def test_batches_are_written_while_pages_arrive():
+    stub = start_spotify_stub()
+    try:
+        track_ids = [f"track{i:03d}" for i in range(250)]
+        playlist = PlaylistStream(stub_client(stub), 'lithium')
+        # Pages of 50 like the xmplaylist API; the first full batch goes out before the scrape ends
+        for start in range(0, len(track_ids), 50):
+            playlist.add(track_ids[start:start + 50])
+        playlist._writes[0].result()
+        (written,) = stub.state.values()
+        assert written['items'][:100] == [f"spotify:track:{tid}" for tid in track_ids[:100]]
+
+        url = playlist.finish()
+        assert url == written['url']
+        assert written['items'] == [f"spotify:track:{tid}" for tid in track_ids]
+
+        # Streaming into the same playlist again replaces its contents
+        again = PlaylistStream(stub_client(stub), 'lithium')
+        again.add(track_ids[:30])
+        assert again.finish() == url
+        assert written['items'] == [f"spotify:track:{tid}" for tid in track_ids[:30]]
+    finally:
+        stub.stop()
+
+def test_empty_stream_creates_nothing():
+    stub = start_spotify_stub()
+    try:
+        playlist = PlaylistStream(stub_client(stub), 'lithium')
+        playlist.add([])
+        assert playlist.finish() is None
+        assert stub.state == {}
+    finally:
+        stub.stop()
@@ -0,0 +1,55 @@
+import os
+import pytest
+import subscriptions
+from cryptography.fernet import Fernet
+
+class FakeOAuth:
+    def refresh_access_token(self, refresh_token):
+        return {'access_token': f"access-{refresh_token}", 'refresh_token': refresh_token}
+
+def test_each_feed_is_scraped_once_per_cycle(state_dir, monkeypatch):
+    monkeypatch.setattr(subscriptions, 'TOKEN_KEY', Fernet.generate_key())
+
+    scraped = []
+    def fake_scrape(url, limit=60):
+        scraped.append((url, limit))
+        return [{'id': f"t{i}"} for i in range(limit)]
+
+    written = []
+    def fake_write(sp, track_ids, station_id, scrape_type, days, station_name, custom_name, user_key=None):
+        written.append((sp._auth, station_id, len(track_ids)))
+        return f"https://open.spotify.com/playlist/{station_id}"
+
+    monkeypatch.setattr(subscriptions, 'scrape_tracks', fake_scrape)
+    monkeypatch.setattr(subscriptions, 'create_playlist_and_add_tracks', fake_write)
+
+    for user in ('alice', 'bob', 'carol'):
+        subscriptions.register_user(user, f"refresh-{user}")
+        subscriptions.add_subscription(user, 'lithium', limit=50 if user == 'alice' else 100)
+    subscriptions.add_subscription('bob', 'altnation', 'most_heard', 30)
+
+    summary = subscriptions.run_subscription_cycle(FakeOAuth())
+
+    assert summary['scrapes'] == 2
+    assert summary['subscriptions'] == 4
+    assert sorted(scraped) == [
+        ('https://xmplaylist.com/station/altnation/most-heard?days=30', 100),
+        ('https://xmplaylist.com/station/lithium', 100),
+    ]
+    assert sorted(written) == [
+        ('access-refresh-alice', 'lithium', 50),
+        ('access-refresh-bob', 'altnation', 100),
+        ('access-refresh-bob', 'lithium', 100),
+        ('access-refresh-carol', 'lithium', 100),
+    ]
+    assert all(r['success'] for r in summary['results'])
+
+    with open(state_dir / 'subscriptions.json') as f:
+        assert 'refresh-alice' not in f.read()
+
+def test_registering_needs_a_token_key(state_dir, monkeypatch):
+    monkeypatch.setattr(subscriptions, 'TOKEN_KEY', None)
+
+    with pytest.raises(ValueError):
+        subscriptions.register_user('alice', 'refresh-alice')
+    assert not os.path.exists(state_dir / 'subscriptions.json')
@@ -0,0 +1,22 @@
+import pytest
+from track_merge import merge_track_lists
+from spotify_client import build_merged_playlist_name, build_playlist_name
+
+def test_interleave_keeps_first_slot_and_drops_duplicates():
+    lists = [['a', 'b', 'c', 'd'], ['x', 'a', 'y'], []]
+    assert merge_track_lists(lists) == ['a', 'x', 'b', 'c', 'y', 'd']
+
+def test_ranked_orders_by_play_count():
+    # 'b' is played three times (twice on the first station), 'a' twice, the rest once
+    lists = [['a', 'b', 'c', 'b'], ['d', 'a', 'b']]
+    assert merge_track_lists(lists, 'ranked') == ['b', 'a', 'd', 'c']
+
+def test_unknown_order():
+    with pytest.raises(ValueError):
+        merge_track_lists([['a']], 'shuffle')
+
+def test_merged_name_never_matches_a_single_station_playlist():
+    assert build_merged_playlist_name(['34 - Lithium', 'Octane']) == "XM Mix: Lithium + Octane - Recently Played"
+    assert build_merged_playlist_name(['Lithium']) != build_playlist_name(station_name='Lithium')
+    assert build_merged_playlist_name(['A', 'B', 'C', 'D', 'E'], 'newest') == "XM Mix: A + B + C + 2 more - Newest Additions"
+    assert build_merged_playlist_name(['Lithium'], custom_name="Road Trip") == "Road Trip"
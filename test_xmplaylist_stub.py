@@ -0,0 +1,95 @@
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import app
+import scraper
+import cache_warmer
+import station_health
+from circuit_breaker import CircuitBreaker
+from stub_servers import start_xmplaylist_stub
+
+def point_scraper_at(stub, monkeypatch):
+    monkeypatch.setattr(scraper, 'XMPLAYLIST_BASE_URL', stub.url)
+    monkeypatch.setattr(scraper, 'STATION_LIST_URL', f"{stub.url}/station")
+
+def test_scraper_reads_stations_and_pages_over_plain_http(monkeypatch):
+    stub = start_xmplaylist_stub(stations=3, pages=3)
+    try:
+        point_scraper_at(stub, monkeypatch)
+        stations = scraper.get_stations()
+        assert [s['id'] for s in stations] == ['station1', 'station2', 'station3']
+        assert stations[0]['url'] == f"{stub.url}/station/station1"
+
+        # 120 tracks spans three 50-track pages; the http next links must be followed as-is
+        tracks = scraper.scrape_tracks(scraper.build_scrape_url('station2'), limit=120)
+        assert [t['id'] for t in tracks] == [f"station2{i:05d}" for i in range(120)]
+        # Coverage is kept in memory; only bulk and cron runs persist it
+        assert scraper.coverage_for('station2', 'recent') == {'seen': 150, 'with_spotify': 150}
+
+        newest = scraper.scrape_tracks(scraper.build_scrape_url('station2', 'newest'), limit=10)
+        assert len(newest) == 10
+    finally:
+        stub.stop()
+
+def test_blocked_requests_raise_upstream_errors(monkeypatch):
+    stub = start_xmplaylist_stub(stations=2, pages=2)
+    try:
+        point_scraper_at(stub, monkeypatch)
+        monkeypatch.setattr(scraper, 'xmplaylist_breaker', CircuitBreaker('xmplaylist.com'))
+        stub.blocked_status = 403
+
+        # A block is an upstream error, not an empty feed
+        with pytest.raises(scraper.UpstreamError, match="blocked the request"):
+            scraper.scrape_tracks(scraper.build_scrape_url('station1', 'newest'))
+        stub.blocked_status = 429
+        with pytest.raises(scraper.UpstreamError, match="HTTP 429"):
+            scraper.scrape_tracks(scraper.build_scrape_url('station1'))
+
+        # A block after the first page keeps the pages already read
+        stub.blocked_status = None
+        pages = scraper.iter_track_pages(scraper.build_scrape_url('station2'), limit=100)
+        first = next(pages)
+        stub.blocked_status = 503
+        assert [len(first)] + [len(page) for page in pages] == [50]
+    finally:
+        stub.stop()
+
+def test_blocked_scrapes_are_not_held_against_the_station(monkeypatch):
+    stub = start_xmplaylist_stub(stations=2, pages=2)
+    try:
+        point_scraper_at(stub, monkeypatch)
+        monkeypatch.setattr(scraper, 'xmplaylist_breaker', CircuitBreaker('xmplaylist.com'))
+        monkeypatch.setattr(cache_warmer, 'cache', cache_warmer.ScrapeCache())
+        stub.blocked_status = 403
+
+        # The breaker needs several calls to trip, so a single block reaches scrape_feed as an upstream error
+        with pytest.raises(scraper.UpstreamError):
+            asyncio.run(app.scrape_feed('station1', 'recent', None, 50))
+        assert station_health.skip_reason('station1', 'recent') is None
+        assert station_health.snapshot() == {}
+    finally:
+        stub.stop()
+
+def test_hedging_under_concurrent_callers(monkeypatch):
+    stub = start_xmplaylist_stub(latency_ms=200, stations=1)
+    try:
+        point_scraper_at(stub, monkeypatch)
+        monkeypatch.setattr(scraper, 'xmplaylist_breaker', CircuitBreaker('xmplaylist.com'))
+        url = f"{stub.url}/api/station/station1/newest"
+
+        # Each caller's delay runs from when its own request is sent, so a crowd of fast requests hedges nothing
+        monkeypatch.setattr(scraper, 'HEDGE_DELAY', 0.3)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=32) as pool:
+            statuses = list(pool.map(lambda _: scraper.upstream_get_json(url, hedge=True)[0], range(32)))
+        assert statuses == [200] * 32
+        assert stub.requests == 32
+        assert time.perf_counter() - start < 0.6
+
+        # A request slower than the delay still gets its duplicate
+        monkeypatch.setattr(scraper, 'HEDGE_DELAY', 0.05)
+        assert scraper.upstream_get_json(url, hedge=True)[0] == 200
+        assert stub.requests == 34
+    finally:
+        stub.stop()
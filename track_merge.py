@@ -0,0 +1,23 @@
+from itertools import zip_longest
+
+MERGE_ORDERS = ('interleave', 'ranked')
+
+def merge_track_lists(track_lists, order='interleave'):
+    # Combines per-station lists of track ids into one playlist, each track once.
+    # interleave: round-robin across stations (1st of each, then 2nd of each, ...), keeping a track's first slot.
+    # ranked: tracks played more often across all stations come first; ties keep the interleaved order.
+    if order not in MERGE_ORDERS:
+        raise ValueError(f"Unknown merge order '{order}' (expected one of {', '.join(MERGE_ORDERS)})")
+
+    # One pass over the interleaved stream; the dict doubles as the seen-set and keeps insertion order
+    plays = {}
+    for row in zip_longest(*track_lists):
+        for track_id in row:
+            if track_id is not None:
+                plays[track_id] = plays.get(track_id, 0) + 1
+
+    merged = list(plays)
+    if order == 'ranked':
+        # sort is stable, so equal play counts stay in interleaved order
+        merged.sort(key=lambda track_id: plays[track_id], reverse=True)
+    return merged